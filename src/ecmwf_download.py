@@ -18,122 +18,190 @@ https://jswhit.github.io/pygrib/index.html
 import argparse
 import json
 import logging
-import math
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import numpy as np
 import numpy.typing as npt
 from ecmwf.opendata import Client as ECMWFClient
-from influxdb_client import InfluxDBClient
+from influxdb_client import InfluxDBClient, WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
 from numpy import array as np_array
-from pygrib import open as pygrib_open
-from scipy.interpolate import RegularGridInterpolator
 
 # internal
+from forecast_energy import (
+    expected_energy,
+    forecast_sites,
+    line_protocol,
+    log_intervals,
+    site_file,
+    write_csv
+)
 from fronius_aux import get_secret
+from grib_stream import PointExtractor, messages
 from sun_influx import SunInflux
 
 # Logging Format
 MYFORMAT: str = ("%(asctime)s :: %(levelname)s: %(filename)s - %(name)s - "
                  "%(lineno)s - %(funcName)s()\t%(message)s")
-SPATIAL_RESOLUTION: float = 0.25
 # data directory relative to source
 DATA_DIR = "{}/data".format(os.path.dirname(os.path.realpath(__file__)))
 
 
-def create_grid(
-        coordinates: npt.ArrayLike,
-        resolution: float
-) -> dict[str, float]:
+def _chunks(
+        steps: list,
+        n: int
+) -> list[list]:
     """
-    create grid on coordinates
-    :param coordinates:
-    :param resolution:
-    :return:
+    split steps into n contiguous chunks of about equal size
+    :param steps:
+    :param n:
+    :return: non-empty chunks in order
     """
 
-    def transpose(x): return (x + 180) % 360 - 180  # [-180, 180[
+    size = -(-len(steps) // max(n, 1))  # ceil
+    return [steps[i:i + size] for i in range(0, len(steps), size)]
 
-    def floor(x): return math.floor(x / resolution) * resolution
 
-    def ceil(x): return math.ceil(x / resolution) * resolution
+def _decode(
+        target: str,
+        coords: npt.ArrayLike
+) -> list[tuple[str, str, str, float | list[float]]]:
+    """
+    interpolate all messages of a GRIB file at coordinates
+    :param target: GRIB file
+    :param coords: latitude, longitude per site
+    :return: name, units, validity and value per site per message
+    """
 
-    return {
-        "lat1": max(-90, floor(coordinates[0])),
-        "lat2": min(90, ceil(coordinates[0])),
-        "lon1": transpose(floor(coordinates[1])),
-        "lon2": transpose(ceil(coordinates[1]))
-    }
+    result: list[tuple[str, str, str, float | list[float]]] = list()
+    extractor = PointExtractor(coordinates=coords)
+
+    # messages streamed from grib file, one at a time
+    for item in messages(target):
+        logging.debug(item)
+        dt_str = "{}{:04d}".format(
+            item['validityDate'],
+            item['validityTime']
+        )
+        result.append(
+            (item['name'], item['units'], dt_str, extractor(item)))
+        del item  # release message before reading the next one
+
+    return result
+
+
+def _retrieve_and_decode(
+        client: ECMWFClient,
+        *,
+        param: str,
+        steps: list,
+        date: datetime | None,
+        target: str,
+        coords: npt.ArrayLike
+) -> list[tuple[str, str, str, float | list[float]]]:
+    """
+    download one parameter (chunk of steps) to its own target and decode it
+    right away, while other downloads are still in progress
+    :return: as _decode
+    """
+
+    kwargs = {"date": date} if date else {}
+    results = client.retrieve(
+        step=steps,
+        type="fc",  # default
+        param=param,
+        # levelist=levelist,
+        model="ifs",  # ifs for the physics-driven and aifs for the data-driven model
+        resol="0p25",
+        # preserve_request_order=True,  # ignored anyway
+        target=target,
+        **kwargs
+    )
+    os.chmod(target, 0o666)  # docker owner is root, anyone can delete
+    logging.info(
+        "Target file: {}\n"
+        "Forecast Run (base time): {}"
+        .format(results.target, results.datetime)
+    )
+    logging.debug("URLs requested: {}".format(results.urls))
+    try:
+        return _decode(target, coords)
+    finally:
+        if os.path.exists(target):
+            os.remove(target)
+            logging.info("File '{}' deleted".format(target))
 
 
 def retrieve_ecmwf(
         params: list,
         steps: list,
         coords: npt.ArrayLike,
-        grid: dict
+        concurrent: bool = True,
+        step_chunks: int = 1,
+        max_workers: int = 4
 ) -> dict:
+    """
+    download and decode all parameters, concurrently if requested: one
+    client (and session) is shared by all downloads, the base time is
+    pinned once, each parameter (chunk of steps) is written to its own
+    target and decoded as soon as downloaded
+    :param params: ECMWF parameters
+    :param steps: forecast steps in hours
+    :param coords: latitude, longitude per site, shape (k, 2), or of one
+    site
+    :param concurrent: if False, parameters are retrieved subsequently
+    :param step_chunks: no of chunks the steps of a parameter are split into
+    :param max_workers: max. no of concurrent downloads
+    :return: name -> {"unit", "time", "value"}, value per site, scalar if
+    of one site
+    """
 
-    file_default = "ecmwf_tmp.grib2"
     dict_x: dict = {}
-    target: str = "{}/{}".format(DATA_DIR, file_default)
-
-    # loop over all parameter
-    for param in params:
-        client = ECMWFClient()
-        results = client.retrieve(
-            step=steps,
-            type="fc",  # default
-            param=param,
-            # levelist=levelist,
-            model="ifs",  # ifs for the physics-driven and aifs for the data-driven model
-            resol="0p25",
-            # preserve_request_order=True,  # ignored anyway
-            target=target,
-            # date='20241212',
-            # time=00
-        )
-        os.chmod(target, 0o666)  # docker owner is root, anyone can delete
-        logging.info(
-            "Target file: {}\n"
-            "Forecast Run (base time): {}"
-            .format(results.target, results.datetime)
-        )
-        logging.debug("URLs requested: {}".format(results.urls))
-
-        fsss = pygrib_open(target)
-        fss = fsss.read()
-        fsss.close()
-
-        # loop over all available time steps
-        for item in fss:
-            logging.debug(item)
-            data, lats, lons = item.data(**grid)
-            nearest_neighbor = RegularGridInterpolator(
-                (lats[:, 0], lons[0, :]),
-                data,
-                method='linear'
-            )
-            value_at_coordinates = list(nearest_neighbor(coords))[0]
-            dt_str = "{}{:04d}".format(
-                item['validityDate'],
-                item['validityTime']
-            )
-            # create a global dict
-            try:
-                dict_x[item['name']]['time'].append(dt_str)
-                dict_x[item['name']]['value'].append(value_at_coordinates)
-            except KeyError:
-                dict_x[item['name']] = {
-                    "unit": item['units'],
-                    "time": [dt_str],
-                    "value": [value_at_coordinates]
-                }
-
-        if os.path.exists("{}/{}".format(DATA_DIR, file_default)):
-            os.remove("{}/{}".format(DATA_DIR, file_default))
-            logging.info("File '{}' deleted".format(file_default))
+    client = ECMWFClient()
+    jobs = [(param, i, chunk)
+            for param in params
+            for i, chunk in enumerate(_chunks(steps, step_chunks))]
+    date: datetime | None = None
+    if len(jobs) > 1:
+        # all jobs of a run from the same base time, even if a new one is
+        # published meanwhile
+        date = client.latest(type="fc",
+                             param=params[0],
+                             step=steps[-1],
+                             model="ifs",
+                             resol="0p25")
+        logging.info("Forecast Run (base time) pinned: {}".format(date))
+
+    with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(jobs)) if concurrent else 1,
+            thread_name_prefix="ecmwf") as executor:
+        futures = [
+            executor.submit(
+                _retrieve_and_decode,
+                client,
+                param=param,
+                steps=chunk,
+                date=date,
+                target="{}/ecmwf_tmp_{}_{}.grib2".format(DATA_DIR, param, i),
+                coords=coords)
+            for param, i, chunk in jobs
+        ]
+        # collected in order of parameters and steps
+        for future in futures:
+            for name, units, dt_str, value in future.result():
+                # create a global dict
+                try:
+                    dict_x[name]['time'].append(dt_str)
+                    dict_x[name]['value'].append(value)
+                except KeyError:
+                    dict_x[name] = {
+                        "unit": units,
+                        "time": [dt_str],
+                        "value": [value]
+                    }
 
     logging.debug(
         json.dumps(
@@ -189,12 +257,15 @@ def main(
 
     # ECMWF open data parameters to be read subsequently
     params: list = config['ecmwf_forecast']['parameter']
-    # Coordinates and its location in the grid
-    coords = np_array([config['location']['latitude'],
-                       config['location']['longitude']])
-    # place a grid cell over the region to be used for forecast and interpolate
-    grid: dict[str, float] = create_grid(coordinates=coords,
-                                         resolution=SPATIAL_RESOLUTION)
+    # Coordinates of all sites, their cells in the grid are located on
+    # decoding, one download serves all sites
+    sites = forecast_sites(config)
+    coords = np_array([[site['location']['latitude'],
+                        site['location']['longitude']]
+                       for _, site in sites])
+    if len(coords) == 1:
+        # a single site keeps scalar values in forecast_ecmwf.json
+        coords = coords[0]
     if extended:
         # HRES 	@ 00 and 12 hrs	UTC, step size: 0 to 144 by 3, 144 to 240 by 6
         steps: list = list(range(0, 144, 3)) + list(range(144, 361, 6))
@@ -212,73 +283,56 @@ def main(
         params=params,
         steps=steps,
         coords=coords,
-        grid=grid
-    )
-
-    z = SunInflux(
-        parameter=config,
-        debug=config['debug']
+        concurrent=config['ecmwf_forecast'].get('concurrent', True),
+        step_chunks=config['ecmwf_forecast'].get('step_chunks', 1),
+        max_workers=config['ecmwf_forecast'].get('max_workers', 4)
     )
 
     data = dict_x["Surface short-wave (solar) radiation downwards"]
     datum = [datetime.strptime(i, '%Y%m%d%H%M') for i in data['time']]
-    values = [i for i in data['value']]
-    records: list = list()
-
-    csv_file_io = open("{}/solar_exp_power_ecmwf.csv".format(DATA_DIR), "w")
-    csv_file_io.write(
-        "{}, {}\n".format("date (UTC)", "expected solar energy (kWh)")
-    )
+    values = np.array(data['value'], dtype=float).reshape(len(datum), -1)
 
-    for i in range(len(datum) - 1):
-        t = z.calc_modified(
-            from_date=datum[i],
-            to_date=datum[i+1]
+    for (tags, site), column in zip(sites, values.T):
+        z = SunInflux(
+            parameter=site,
+            debug=config['debug']
         )
-        r1 = t[0] * 3_600  # convert W to J
-        r2 = t[1] / 1_000  # convert to kWh
-
+        # solar geometry integrated over the entire horizon in one pass
+        horizon = z.calc_horizon(dates=datum)
+        maximum = horizon[0] * 3_600  # convert W to J
+        panels = horizon[1] / 1_000  # convert to kWh
         # may be slightly negative by calculations of ECMWF (accumulated ssrd)!
-        forecasted_flux = max(values[i + 1] - values[i], 0.)
-
-        logging.debug(
-            "Date: {}, "
-            "Forecasted Flux [J m**-2]: {:.2E}, "
-            "Max Flux [J m**-2]: {:.2E}, "
-            "ratio: {:.3}, "
-            "Energy on PV panels [kW]: {:.3}, "
-            "Energy on PV panels corr. [kW]: {:.3}".format(
-                datum[i],
-                forecasted_flux,
-                r1,
-                r1 and forecasted_flux / r1 or 0.,
-                r2,
-                r2 * (r1 and forecasted_flux / r1 or 0.))
-        )
-
-        csv_file_io.write(
-            "{}, {}\n".format(datum[i],
-                              r2 * (r1 and forecasted_flux / r1 or 0.))
-        )
-
-        records.append(
-            {
-                "measurement": "Forecast",
-                "time": datum[i],
-                "fields": {"ssrd": r2 * (r1 and forecasted_flux / r1 or 0.)}
-            }
-        )
-    # end for loop over date/time entries
-
-    if not test:
-        influx_write_api.write(
-            bucket="Fronius",
-            org="Fronius",
-            record=records
-        )
+        forecasted_flux = np.maximum(np.diff(column), 0.)
+        energy, ratio = expected_energy(flux=forecasted_flux,
+                                        maximum=maximum,
+                                        panels=panels)
+
+        if tags:
+            logging.debug("Location: {}".format(tags['location']))
+        log_intervals(datum[:-1], {
+            "Forecasted Flux [J m**-2]": forecasted_flux,
+            "Max Flux [J m**-2]": maximum,
+            "ratio": ratio,
+            "Energy on PV panels [kW]": panels,
+            "Energy on PV panels corr. [kW]": energy})
+        write_csv(site_file("{}/solar_exp_power_ecmwf.csv".format(DATA_DIR),
+                            tags),
+                  ("date (UTC)", "expected solar energy (kWh)"),
+                  datum[:-1],
+                  energy)
+
+        if not test:
+            influx_write_api.write(
+                bucket="Fronius",
+                org="Fronius",
+                record=line_protocol(measurement="Forecast",
+                                     times=datum[:-1],
+                                     fields={"ssrd": energy},
+                                     tags=tags),
+                write_precision=WritePrecision.S
+            )
 
     influx_write_api.close()
-    csv_file_io.close()
 
     logging.info(f"{os.path.basename(__file__)} exited.")
     sys.exit(0)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+"""
+forecast_energy.py
+
+batch conversion of forecasted irradiation into expected energy on the PV
+panels, shared by ECMWF, GFS and open-meteo: all intervals of a forecast are
+converted in one vectorized pass, the clear-sky energy on the panels being
+scaled by the ratio of forecasted to clear-sky irradiation on the ground.
+Results are emitted in bulk as CSV and as influxDB line protocol, per site
+if several locations are configured.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+# internal
+from fronius_lineprotocol import LineProtocolEncoder
+
+
+def forecast_sites(
+        config: dict
+) -> list[tuple[dict[str, str] | None, dict]]:
+    """
+    sites a forecast is extracted for: "locations" in parameter.json, each
+    inheriting missing keys from "location" and its own "housetop" optional,
+    tagged by "name" (default "city"), which has to be unique, or "location"
+    alone
+    :param config: parameter.json
+    :return: tags (None for "location" alone) and parameter per site
+    """
+
+    if not config.get('locations'):
+        return [(None, config)]
+
+    result: list[tuple[dict[str, str] | None, dict]] = list()
+    for site in config['locations']:
+        location = {**config['location'], **site}
+        location.pop('housetop', None)
+        result.append((
+            {"location": site.get('name', location['city'])},
+            {**config,
+             "location": location,
+             "housetop": site.get('housetop', config['housetop'])}
+        ))
+    # tag names CSV files and Forecast points, sites must not overwrite
+    names = [tags['location'] for tags, _ in result]
+    assert len(set(names)) == len(names), \
+        "Locations need a unique name, duplicates: {}!".format(
+            sorted({name for name in names if names.count(name) > 1}))
+
+    return result
+
+
+def site_file(
+        file: str,
+        tags: dict[str, str] | None
+) -> str:
+    """
+    :param file: name of file
+    :param tags: of site
+    :return: name of file with site appended, if tagged
+    """
+
+    if not tags:
+        return file
+    root, ext = os.path.splitext(file)
+
+    return "{}_{}{}".format(root, tags['location'], ext)
+
+
+def clear_sky_ratio(
+        flux: npt.ArrayLike,
+        maximum: npt.ArrayLike
+) -> np.ndarray:
+    """
+    ratio of forecasted to clear-sky irradiation, 0 where the latter is 0
+    (at night)
+    :param flux: forecasted irradiation on the ground per interval
+    :param maximum: clear-sky irradiation on the ground per interval, same
+    units as flux
+    :return:
+    """
+
+    flux = np.asarray(flux, dtype=float)
+    maximum = np.asarray(maximum, dtype=float)
+
+    return np.divide(flux, maximum,
+                     out=np.zeros(np.broadcast(flux, maximum).shape),
+                     where=maximum != 0.)
+
+
+def expected_energy(
+        *,
+        flux: npt.ArrayLike,
+        maximum: npt.ArrayLike,
+        panels: npt.ArrayLike
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    expected direct energy on the PV panels per interval
+    :param flux: forecasted irradiation on the ground
+    :param maximum: clear-sky irradiation on the ground, same units as flux
+    :param panels: clear-sky direct energy on the PV panels
+    :return: energy in units of panels, clear-sky ratio it is based on
+    """
+
+    ratio = clear_sky_ratio(flux, maximum)
+
+    return np.asarray(panels, dtype=float) * ratio, ratio
+
+
+def log_intervals(
+        times: Sequence[datetime],
+        columns: dict[str, npt.ArrayLike]
+) -> None:
+    """
+    one debug line per interval, skipped entirely unless debugging
+    :param times:
+    :param columns: label -> values per interval
+    :return:
+    """
+
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return
+    values = [np.asarray(v, dtype=float).tolist() for v in columns.values()]
+    for time, row in zip(times, zip(*values)):
+        logging.debug("Date: {}, {}".format(
+            time,
+            ", ".join("{}: {:.3}".format(label, value)
+                      for label, value in zip(columns, row))))
+
+
+def write_csv(
+        file: str,
+        header: Sequence[str],
+        times: Sequence[datetime],
+        *columns: npt.ArrayLike
+) -> None:
+    """
+    write all intervals at once
+    :param file:
+    :param header: incl. the date column
+    :param times: first column
+    :param columns: further columns, one value per interval
+    :return:
+    """
+
+    values = [np.asarray(c, dtype=float).tolist() for c in columns]
+    with open(file, "w") as f:
+        f.write(", ".join(header) + "\n")
+        f.write("".join(
+            ", ".join(map(str, row)) + "\n"
+            for row in zip(times, *values)))
+
+
+def line_protocol(
+        *,
+        measurement: str,
+        times: Sequence[datetime],
+        fields: dict[str, npt.ArrayLike],
+        tags: dict[str, str] | None = None,
+        write_precision: str = "s"
+) -> bytes:
+    """
+    all intervals as influxDB line protocol
+    :param measurement:
+    :param times: naive UTC or aware
+    :param fields: field -> values per interval
+    :param tags: shared by all records, none if None
+    :param write_precision: [s|ms|us|ns]
+    :return: one record per line
+    """
+
+    values = [np.asarray(v, dtype=float).tolist() for v in fields.values()]
+
+    return LineProtocolEncoder(
+        write_precision=write_precision,
+        measurements={measurement: fields}
+    ).encode(
+        {
+            "measurement": measurement,
+            "tags": tags,
+            "time": time,
+            "fields": dict(zip(fields, row))
+        }
+        for time, row in zip(times, zip(*values))
+    )
@@ -4,16 +4,15 @@ import json
 import logging
 import os
 import sys
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from time import sleep
-from timeit import default_timer
+from itertools import repeat
 
-import requests
 from astral import LocationInfo
-from astral.sun import elevation, azimuth
+from astral.sun import elevation, azimuth, sunrise, sunset
 from influxdb_client import InfluxDBClient, WriteOptions
-from influxdb_client.client.write_api import SYNCHRONOUS, WritePrecision
-from requests.exceptions import ConnectionError, HTTPError
+from influxdb_client.client.write_api import SYNCHRONOUS
+from requests.exceptions import ConnectionError, HTTPError, Timeout
 
 # internal imports
 from src.fronius_aux import (
@@ -25,10 +24,21 @@ from src.fronius_aux import (
     _Meta,
     StatusErrors,
     Math,
+    PanelArray,
     air_mass,
-    direct_radiation_on_tilted_surface,
     SOLAR_CONSTANT
 )
+from src.fronius_collector import DeviceCollector
+from src.fronius_compression import Compression
+from src.fronius_http import (
+    EndpointFetcher,
+    inverter_session,
+    timeout_from_parameter
+)
+from src.fronius_mapping import MappingRegistry
+from src.fronius_scheduler import AdaptivePolling, TickScheduler
+from src.fronius_spool import Spool
+from src.fronius_writer import InfluxWriter
 from src.fronius_ws_sync_client import WSSyncClient
 from src.wattpilot import Wattpilot
 from src.wattpilot_read import wattpilot_get, wattpilot_status
@@ -84,6 +94,7 @@ class FroniusToInflux(object):
             parameter: dict,
             endpoints: _Meta,
             wallbox: Wattpilot | None,
+            mapping: MappingRegistry,
             **kwargs
     ) -> None:
         """
@@ -92,15 +103,18 @@ class FroniusToInflux(object):
         :param parameter: parameter as read from parameter.json
         :param endpoints: endpoints to read from inverter
         :param wallbox: wallbox to read from
+        :param mapping: compiled mapping of responses to records
         :param kwargs: (optional)
             dry_run: if true no data is written to influxDB (default: false)
-            write_cycle: write interval for influxDB in seconds (default: 60)
+            write_cycle: max. age of records before being flushed to
+            influxDB in seconds (default: 60)
         """
 
         self.client = client
         self.endpoints = endpoints
         self.parameter = parameter
         self.wallbox = wallbox
+        self.mapping = mapping
         self.location = LocationInfo(
             name=parameter['location']['city'],
             region=parameter['location']['region'],
@@ -108,37 +122,17 @@ class FroniusToInflux(object):
             longitude=parameter['location']['longitude'],
             timezone=parameter['location']['timezone']
         )
+        self.panels = PanelArray(parameter['housetop'])
         self.data: dict = dict()
+        self.elevation: float | None = None  # of most recent sun_parameter
         self.ignore_sun_down: bool = False
         self.dry_run: bool = kwargs.get('dry_run', False)
-        # write cycle no in multiples of BACKOFF_INTERVAL
-        self.write_cycle_no: int = int(
-            kwargs.get('write_cycle', 60) / self.BACKOFF_INTERVAL
-        )
-
-    def get_float_or_zero(
-            self,
-            value: str
-    ) -> float:
-        """
-        Get value of parameter value: either float or zero
-        :param value:
-        :return:
-        """
-
-        try:
-            internal_data: dict[str, dict] = self.data['Body']['Data']
-        except KeyError:
-            raise WrongFroniusData('Response structure is not healthy.')
-
-        return 0. if 'Value' not in internal_data.get(value, {}) \
-                     or internal_data.get(value, {}).get('Value') is None \
-            else float(internal_data.get(value)['Value'])
+        self.write_cycle: int = kwargs.get('write_cycle', 60)
 
     def translate_response(self) -> list[dict[str, str | dict]]:
         """
         prepare data for writing to influxDB with fields each measurement
-        at timestamp
+        at timestamp, as defined by the mapping registry
         :return:
         """
 
@@ -155,125 +149,16 @@ class FroniusToInflux(object):
                 ))
 
         try:
-            storage = \
-                self.data['Body']['Data']['Controller']['Details']['Model']
+            data: dict = self.data['Body']['Data']
         except KeyError:
-            storage = None
-
-        try:
-            meter = self.data['Body']['Data']['Details']['Model']
-        except KeyError:
-            meter = None
-
-        if collection == 'CommonInverterData':
-            device_status = self.data['Body']['Data']['DeviceStatus']
-            return [
-                {
-                    'measurement': 'DeviceStatus',
-                    'time': timestamp,
-                    'fields': {
-                        'ErrorCode': device_status['ErrorCode'],
-                        'InverterState': device_status['InverterState'],
-                        'StatusCode': device_status['StatusCode']
-                    }
-                },
-                {
-                    'measurement': collection,
-                    'time': timestamp,
-                    'fields': {
-                        'PAC': self.get_float_or_zero('PAC'),
-                        'SAC': self.get_float_or_zero('SAC'),
-                        'IAC': self.get_float_or_zero('IAC'),
-                        'UAC': self.get_float_or_zero('UAC'),
-                        'FAC': self.get_float_or_zero('FAC'),
-                        'IDC': self.get_float_or_zero('IDC'),
-                        'IDC_2': self.get_float_or_zero('IDC_2'),
-                        'UDC': self.get_float_or_zero('UDC'),
-                        'UDC_2': self.get_float_or_zero('UDC_2'),
-                        'DAY_ENERGY': self.get_float_or_zero('DAY_ENERGY'),
-                        'YEAR_ENERGY': self.get_float_or_zero('YEAR_ENERGY'),
-                        'TOTAL_ENERGY': self.get_float_or_zero('TOTAL_ENERGY'),
-                    }
-                }
-            ]
-
-        elif collection == '3PInverterData':
-            return [
-                {
-                    'measurement': collection,
-                    'time': timestamp,
-                    'fields': {
-                        'IAC_L1': self.get_float_or_zero('IAC_L1'),
-                        'IAC_L2': self.get_float_or_zero('IAC_L2'),
-                        'IAC_L3': self.get_float_or_zero('IAC_L3'),
-                        'UAC_L1': self.get_float_or_zero('UAC_L1'),
-                        'UAC_L2': self.get_float_or_zero('UAC_L2'),
-                        'UAC_L3': self.get_float_or_zero('UAC_L3'),
-                    }
-                }
-            ]
-
-        elif collection is None and storage == "BYD Battery-Box Premium HV":
-            c = self.data['Body']['Data']['Controller']
-            return [
-                {
-                    'measurement': "Battery",
-                    'time': timestamp,
-                    'fields': {
-                        'Current_DC': float(c.get(
-                            'Current_DC', 0.)),
-                        'Enable': c.get('Enable', -1),
-                        'StateOfCharge_Relative': float(c.get(
-                            'StateOfCharge_Relative', -1.)),
-                        'Status_BatteryCell': float(c.get(
-                            'Status_BatteryCell', -1.)),
-                        'Temperature_Cell': float(c.get(
-                            'Temperature_Cell', -1.)),
-                        'Voltage_DC': float(c.get('Voltage_DC', 0.))
-                    }
-                }
-            ]
-
-        elif collection is None and meter == "Smart Meter TS 65A-3":
-            m = self.data['Body']['Data']
-            return [
-                {
-                    'measurement': "SmartMeter",
-                    'time': timestamp,
-                    'fields': {
-                        'Enable': m.get(
-                            'Enable', -1),
-                        'Visible': m.get(
-                            'Visible', -1),
-                        'PowerReal_P_Sum': float(m.get(
-                            'PowerReal_P_Sum', 0.)),
-                        'PowerReal_P_Phase_1': float(m.get(
-                            'PowerReal_P_Phase_1', 0.)),
-                        'PowerReal_P_Phase_2': float(m.get(
-                            'PowerReal_P_Phase_2', 0.)),
-                        'PowerReal_P_Phase_3': float(m.get(
-                            'PowerReal_P_Phase_3', 0.)),
-                        'Current_AC_Sum': float(m.get(
-                            'Current_AC_Sum', 0.)),
-                        'Current_AC_Phase_1': float(m.get(
-                            'Current_AC_Phase_1', 0.)),
-                        'Current_AC_Phase_2': float(m.get(
-                            'Current_AC_Phase_2', 0.)),
-                        'Current_AC_Phase_3': float(m.get(
-                            'Current_AC_Phase_3', 0.)),
-                        'Voltage_AC_Phase_1': float(m.get(
-                            'Voltage_AC_Phase_1', 0.)),
-                        'Voltage_AC_Phase_2': float(m.get(
-                            'Voltage_AC_Phase_2', 0.)),
-                        'Voltage_AC_Phase_3': float(m.get(
-                            'Voltage_AC_Phase_3', 0.)),
-                    }
-                }
-            ]
+            raise WrongFroniusData('Response structure is not healthy.')
 
-        else:
+        extractors = self.mapping.extractors(collection, data)
+        if extractors is None:
             raise DataCollectionError("Unknown data collection type.")
 
+        return [extract(data, timestamp) for extract in extractors]
+
     def sun_parameter(self) -> list[dict[str, str | dict]]:
         """
         prepare sun energy parameters at current time and write
@@ -284,6 +169,7 @@ class FroniusToInflux(object):
         result: dict[str, dict | float]
         el = elevation(observer=self.location.observer,
                        with_refraction=True)
+        self.elevation = el
         if el > 0:
             altitude = self.parameter["location"]["altitude"]["value"]
             az = azimuth(observer=self.location.observer)
@@ -306,12 +192,9 @@ class FroniusToInflux(object):
                 az,
                 air_mass_revised,
                 air_mass_attenuation))
-            for item, value in self.parameter['housetop'].items():
-                r = direct_radiation_on_tilted_surface(
-                    elevation=el,
-                    azimuth=az,
-                    inclination=value['inclination']['value'],
-                    orientation=value['orientation']['value'])
+            for item, area_eff, r in zip(self.panels.names,
+                                         self.panels.area_eff,
+                                         self.panels.incidence(el, az)):
                 incidence_angle_sun = Math.asindeg(r)
                 logging.debug("{0}, "
                               "incidence angle: {1} deg, "
@@ -322,9 +205,7 @@ class FroniusToInflux(object):
                     r,
                     intens * r))
                 result[item] = {
-                    "intensity_corr_area_eff": intens
-                                               * value['area']['value']
-                                               * value['efficiency']['value'],
+                    "intensity_corr_area_eff": intens * area_eff,
                     "incidence_ratio": r
                 }
             return [
@@ -340,6 +221,30 @@ class FroniusToInflux(object):
             else:
                 return []
 
+    def seconds_until_sunrise(self) -> float:
+        """
+        period of time until the next sunrise. If the sun has risen already
+        today, but its elevation is not yet positive, RETRY_PERIOD applies
+        :return: seconds
+        """
+
+        now = datetime.now(tz=timezone.utc)
+        try:
+            for day in (now.date(), now.date() + timedelta(days=1)):
+                rise = sunrise(self.location.observer,
+                               date=day,
+                               tzinfo=timezone.utc)
+                if rise > now:
+                    return (rise - now).total_seconds()
+                if now < sunset(self.location.observer,
+                                date=day,
+                                tzinfo=timezone.utc):
+                    break  # at daytime already
+        except ValueError:  # sun never rises or sets at this day
+            pass
+
+        return self.RETRY_PERIOD
+
     def run(self) -> None:
         """
         runs eternally, collects data and writes it to InfluxDB
@@ -348,17 +253,70 @@ class FroniusToInflux(object):
 
         collected_data: list[dict[str, str | dict]] = []
         websocket_data: list[dict[str, str | dict]] = []
-        content_tmp: list = []
         wallbox_status_fields_previous: dict = {'Wallbox connected': True}
         flag_sun_is_down: bool = False
         flag_connection: bool = False
         flag_exception: bool = False
-        counter: int = 1
-
-        write_api = self.client.write_api(  # batch mode
-            # write_options=WriteOptions(flush_interval=1_000)  # flush after 1s
-            write_options=WriteOptions(SYNCHRONOUS)
+        skipped_devices: set[tuple] = set()  # logged once
+        scheduler = TickScheduler(interval=self.BACKOFF_INTERVAL)
+        polling_parameter: dict = self.parameter.get('polling', {})
+        adaptive_polling = AdaptivePolling(
+            **{k: v for k, v in polling_parameter.items() if k != 'adaptive'}
+        ) if polling_parameter.get('adaptive', False) else None
+
+        server: dict = self.parameter['server']
+        collector_parameter: dict = server.get('collector', {})
+        timeout = timeout_from_parameter(server.get('timeout', 4.))
+        fetch_endpoints: EndpointFetcher | DeviceCollector
+        if collector_parameter.get('active', False):
+            # all devices of all hosts, records tagged by host and device
+            hosts: list[str] = collector_parameter.get('hosts',
+                                                       [server['host']])
+            fetch_endpoints = DeviceCollector(
+                hosts=hosts,
+                application=server['application'],
+                session=inverter_session(
+                    **server.get('session', {}) | {
+                        'pool_connections': len(hosts)}
+                ),
+                timeout=timeout,
+                min_interval=collector_parameter.get('min_interval', 0.),
+                max_per_host=collector_parameter.get('max_per_host', 2)
+            )
+        else:
+            fetch_endpoints = EndpointFetcher(
+                endpoints=self.endpoints,
+                session=inverter_session(**server.get('session', {})),
+                timeout=timeout,
+                concurrent=server.get('concurrent', True)
+            )
+        # batches that failed are kept on disk and replayed thereafter
+        spool_parameter: dict = self.parameter['influxdb'].get('spool', {})
+        spool = Spool(
+            path="{}/data/{}".format(
+                os.path.dirname(os.path.realpath(__file__)),
+                spool_parameter.get('path', "spool/fronius.sqlite3")),
+            max_size=spool_parameter.get('max_size', 50_000_000)
+        ) if spool_parameter.get('active', False) else None
+        # batches are written by a background thread, polling never waits
+        writer = InfluxWriter(
+            write_api=self.client.write_api(
+                write_options=WriteOptions(SYNCHRONOUS)
+            ),
+            bucket=self.parameter['influxdb']['bucket'],
+            org=self.parameter['influxdb']['organization'],
+            flush_interval=self.write_cycle,
+            dry_run=self.dry_run,
+            spool=spool,
+            **self.parameter['influxdb'].get('writer', {})
         )
+        writer.start()
+        # change-only compression of fields in front of the writer
+        compression_parameter: dict = self.parameter.get('compression', {})
+        compression = Compression(
+            measurements=compression_parameter.get('measurements', {}),
+            heartbeat=compression_parameter.get('heartbeat', 300.)
+        ) if compression_parameter.get('active', False) else None
         # for Rest API's ws client, we will have one connection solely
         ws_client = WSSyncClient(
             application=self.parameter['RestAPI']['websocket'],
@@ -368,16 +326,31 @@ class FroniusToInflux(object):
         try:
             while True:
                 try:
-                    # get endpoints, time between each get request is ~20ms
-                    content_tmp.clear()  # clearing a small list is 7% faster!
-                    for url in self.endpoints:
-                        content = requests.get(url)
-                        content.raise_for_status()  # HTTP status
-                        content_tmp.append(content)
-
-                    for content in content_tmp:
-                        self.data = content.json()
-                        fronius_data = self.translate_response()
+                    # get endpoints, in parallel if configured
+                    if isinstance(fetch_endpoints, DeviceCollector):
+                        contents = fetch_endpoints()
+                    else:
+                        contents = zip(repeat(None), fetch_endpoints())
+                    for tags, content in contents:
+                        try:
+                            self.data = content.json()
+                            fronius_data = self.translate_response()
+                        except (DataCollectionError,
+                                ResponseHeaderError,
+                                WrongFroniusData) as e:
+                            if tags is None:  # endpoints configured
+                                raise
+                            # device discovered, e.g. of a model unknown
+                            # to the mapping, skipped w/o the others
+                            device = tuple(tags.items())
+                            if device not in skipped_devices:
+                                logging.warning(
+                                    "Device {} skipped: {}".format(tags, e))
+                                skipped_devices.add(device)
+                            continue
+                        if tags:
+                            for record in fronius_data:
+                                record['tags'] = tags
                         # append data
                         collected_data.extend(fronius_data)
                         websocket_data.extend(fronius_data)  # transfer via ws
@@ -400,25 +373,16 @@ class FroniusToInflux(object):
                             collected_data.extend(wallbox_status)
                             wallbox_status_fields_previous = wallbox_status[0]['fields']
 
-                    if counter >= self.write_cycle_no:  # no of cycles to skip
-                        if logging.DEBUG >= logging.root.level:
-                            print(collected_data)
-                        if not self.dry_run:
-                            start_time = default_timer()
-                            write_api.write(
-                                bucket="Fronius",
-                                org="Fronius",
-                                record=collected_data,
-                                write_precision=WritePrecision.S
-                            )
-                            logging.debug(
-                                "Time consumed for influxDB "
-                                "Sync Write API': {0:.2f} ms".format(
-                                    (default_timer() - start_time) * 1_000))
-                        collected_data.clear()  # faster than assign new list
-                        counter = 1
-                    else:
-                        counter += 1
+                    # no of ticks until next poll
+                    ticks = adaptive_polling(
+                        elevation=self.elevation,
+                        records=collected_data
+                    ) if adaptive_polling else 1
+
+                    # hand over to writer, batched by size and age
+                    writer.put(compression(collected_data)
+                               if compression else collected_data)
+                    collected_data.clear()  # faster than assign new list
 
                     # transfer via websocket to HTTP Rest API & clear thereafter
                     ws_client(websocket_data)
@@ -432,23 +396,30 @@ class FroniusToInflux(object):
                     flag_connection = False
                     flag_exception = False
 
-                    sleep(self.BACKOFF_INTERVAL)
+                    # wait for next tick, or later if polling is adaptive
+                    scheduler.wait(ticks)
 
                 except SunIsDown:
+                    delay = self.seconds_until_sunrise()
                     if not flag_sun_is_down:
-                        logging.warning("Waiting for sun to rise ...")
+                        logging.warning(
+                            "Waiting {:.0f}s for sun to rise ...".format(delay))
                         flag_sun_is_down = True
-                    sleep(self.RETRY_PERIOD)
+                    scheduler.resync(delay)
 
-                except (ConnectionError, HTTPError, ResponseHeaderError) as e:
+                except (ConnectionError,
+                        HTTPError,
+                        Timeout,
+                        ResponseHeaderError) as e:
                     if not flag_connection:
                         logging.error(
-                            f"Connection/HTTP/Response Header error: {str(e)}")
+                            f"Connection/HTTP/Timeout/Response Header error: "
+                            f"{str(e)}")
                         logging.warning(
                             f"Waiting {self.RETRY_PERIOD}s for exception to suspend ..."
                         )
                         flag_connection = True
-                    sleep(self.RETRY_PERIOD)
+                    scheduler.resync(self.RETRY_PERIOD)
 
                 except Exception as e:
                     if not flag_exception:
@@ -457,7 +428,7 @@ class FroniusToInflux(object):
                             f"Waiting {self.RETRY_PERIOD}s for exception to suspend ..."
                         )
                         flag_exception = True
-                    sleep(self.RETRY_PERIOD)
+                    scheduler.resync(self.RETRY_PERIOD)
 
         except KeyboardInterrupt:
             print("Exiting. Goodbye! See you next time!")
@@ -467,6 +438,13 @@ class FroniusToInflux(object):
             print(f"Unknown error: {str(e)}")
             sys.exit(os.EX_OSERR)
 
+        finally:
+            fetch_endpoints.close()
+            if compression:
+                writer.put(compression.flush())
+                logging.info(compression)
+            writer.close()
+
 
 def main() -> None:
     """
@@ -482,6 +460,10 @@ def main() -> None:
         ))
     with open(parameter_file, 'r') as f:
         parameter = json.load(f)
+    mapping = MappingRegistry.from_file("{}/data/mapping.json".format(
+        os.path.dirname(
+            os.path.realpath(__file__)
+        )))
 
     logging_level: str = "DEBUG" if parameter['debug'] else "INFO"
     logging.basicConfig(format=MYFORMAT,
@@ -526,7 +508,9 @@ def main() -> None:
         parameter=parameter,
         endpoints=endpoints,
         wallbox=wallbox,
-        dry_run=parameter['dry_run']
+        mapping=mapping,
+        dry_run=parameter['dry_run'],
+        write_cycle=parameter.get('write_cycle', 60)
     )
     z.ignore_sun_down = parameter['ignore_sun_down']
     z.run()
@@ -161,6 +161,84 @@ def direct_radiation_on_tilted_surface(
     )
 
 
+class PanelArray(object):
+    def __init__(
+            self,
+            housetop: dict[str, dict]
+    ) -> None:
+        """
+        panel groups of housetop (parameter.json) compiled once into a
+        struct of arrays, trigonometric terms and diffuse factors precomputed
+        :param housetop:
+        """
+
+        self.names: tuple[str, ...] = tuple(housetop)
+        panels = tuple(housetop.values())
+        self.inclination: tuple[float, ...] = tuple(
+            float(v['inclination']['value']) for v in panels)
+        self.orientation: tuple[float, ...] = tuple(
+            float(v['orientation']['value']) for v in panels)
+        self.area_eff: tuple[float, ...] = tuple(
+            v['area']['value'] * v['efficiency']['value'] for v in panels)
+        self.sin_inclination: tuple[float, ...] = tuple(
+            map(Math.sindeg, self.inclination))
+        self.cos_inclination: tuple[float, ...] = tuple(
+            map(Math.cosdeg, self.inclination))
+        self.sin_orientation: tuple[float, ...] = tuple(
+            map(Math.sindeg, self.orientation))
+        self.cos_orientation: tuple[float, ...] = tuple(
+            map(Math.cosdeg, self.orientation))
+        # diffuse sunlight on the tilted panels relative to the ground
+        self.diffuse_factor: tuple[float, ...] = tuple(
+            a * (1. + c) * 0.5
+            for a, c in zip(self.area_eff, self.cos_inclination))
+        self.diffuse: float = sum(self.diffuse_factor)
+        self.__terms = tuple(zip(self.sin_inclination,
+                                 self.cos_inclination,
+                                 self.sin_orientation,
+                                 self.cos_orientation))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def incidence(
+            self,
+            elevation: float,
+            azimuth: float
+    ) -> list[float]:
+        """
+        direct_radiation_on_tilted_surface for all panel groups, with
+        cos(orientation - azimuth) expanded into the precomputed terms
+        :param elevation: sun elevation angle in degrees
+        :param azimuth: sun azimuth angle in degrees
+        :return: incidence ratio per panel group
+        """
+
+        sin_el, cos_el = Math.sindeg(elevation), Math.cosdeg(elevation)
+        sin_az, cos_az = Math.sindeg(azimuth), Math.cosdeg(azimuth)
+
+        return [
+            max(cos_el * sin_i * (cos_o * cos_az + sin_o * sin_az)
+                + sin_el * cos_i, 0.)
+            for sin_i, cos_i, sin_o, cos_o in self.__terms
+        ]
+
+    def direct(
+            self,
+            elevation: float,
+            azimuth: float
+    ) -> float:
+        """
+        direct sunlight on all panel groups relative to the beam intensity
+        :param elevation: sun elevation angle in degrees
+        :param azimuth: sun azimuth angle in degrees
+        :return: effective area in m²
+        """
+
+        return sum(a * r for a, r in zip(self.area_eff,
+                                         self.incidence(elevation, azimuth)))
+
+
 def current_time_utc() -> str:
     return datetime.now(tz=timezone.utc).isoformat(timespec='seconds')
 
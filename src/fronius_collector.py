@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+"""
+fronius_collector.py
+
+discovers all devices (inverters, storages, meters) of N Fronius hosts via
+the Solar API's GetActiveDeviceInfo and polls them concurrently, limited
+per host in concurrency and per device in rate. Responses are returned with
+tags identifying host and device, such that one process serves the entire
+installation.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Iterable
+
+import requests
+from requests import Response
+
+DISCOVERY = "GetActiveDeviceInfo.cgi?DeviceClass=System"
+DEVICE_ENDPOINTS: dict[str, str] = {
+    "Inverter": "GetInverterRealtimeData.cgi?Scope=Device"
+                "&DataCollection=CommonInverterData&DeviceId={}",
+    "Storage": "GetStorageRealtimeData.cgi?Scope=Device&DeviceId={}",
+    "Meter": "GetMeterRealtimeData.cgi?Scope=Device&DeviceId={}"
+}
+# polls aligned to scheduler ticks may arrive slightly early
+_TOLERANCE: float = 0.5  # seconds
+
+
+class Device(object):
+    def __init__(
+            self,
+            *,
+            host: str,
+            application: str,
+            device_class: str,
+            device_id: str
+    ) -> None:
+        self.host = host
+        self.device_class = device_class
+        self.device_id = device_id
+        self.url = "http://{}{}{}".format(
+            host,
+            application,
+            DEVICE_ENDPOINTS[device_class].format(device_id))
+        self.tags: dict[str, str] = {
+            "host": host,
+            "device_class": device_class,
+            "device_id": device_id
+        }
+        self.last_polled: float = float('-inf')
+
+    def __repr__(self) -> str:
+        return "{}:{}:{}".format(self.host, self.device_class, self.device_id)
+
+
+class DeviceCollector(object):
+    def __init__(
+            self,
+            *,
+            hosts: Iterable[str],
+            application: str,
+            session: requests.Session | None = None,
+            timeout: float | tuple[float, float] = 4.,
+            min_interval: float = 0.,
+            max_per_host: int = 2,
+            rediscover_period: float = 3_600.
+    ) -> None:
+        """
+        :param hosts: Fronius hosts
+        :param application: path of the Solar API
+        :param session: shared session, a plain one is created if None
+        :param timeout: timeout of each GET request in seconds
+        :param min_interval: min. seconds between two polls of a device
+        :param max_per_host: max. no of concurrent requests per host
+        :param rediscover_period: seconds between device discoveries
+        """
+
+        self.hosts: list[str] = list(hosts)
+        self.application = application
+        self.session = session if session else requests.Session()
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.rediscover_period = rediscover_period
+        self.devices: list[Device] = list()
+        self.__host_limits: dict[str, threading.BoundedSemaphore] = {
+            host: threading.BoundedSemaphore(max_per_host)
+            for host in self.hosts
+        }
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_per_host * len(self.hosts),
+            thread_name_prefix="collector"
+        )
+        self.__discovered: float = float('-inf')
+        self.__failed: set[str] = set()  # devices failed on last poll
+
+    def _discover_host(
+            self,
+            host: str
+    ) -> list[Device]:
+        """
+        GetActiveDeviceInfo of one host, device classes without realtime
+        endpoint are ignored
+        :param host:
+        :return: devices
+        """
+
+        with self.__host_limits[host]:
+            content = self.session.get(
+                "http://{}{}{}".format(host, self.application, DISCOVERY),
+                timeout=self.timeout)
+        content.raise_for_status()
+        data: dict = content.json()['Body']['Data']
+
+        return [
+            Device(host=host,
+                   application=self.application,
+                   device_class=device_class,
+                   device_id=str(device_id))
+            for device_class, devices in data.items()
+            if device_class in DEVICE_ENDPOINTS
+            for device_id in (devices or {})
+        ]
+
+    def discover(self) -> list[Device]:
+        """
+        discover devices of all hosts concurrently. Devices of hosts that fail
+        are kept from a previous discovery. The first exception is re-raised
+        only if no device is known at all
+        :return: devices
+        """
+
+        devices: list[Device] = list()
+        exception: Exception | None = None
+        previous = {(d.host, d.device_class, d.device_id): d
+                    for d in self.devices}
+        futures = {host: self.__executor.submit(self._discover_host, host)
+                   for host in self.hosts}
+        for host, future in futures.items():
+            try:
+                for device in future.result():
+                    # keep rate limit state of known devices
+                    devices.append(previous.get(
+                        (device.host, device.device_class, device.device_id),
+                        device))
+            except (Exception,) as e:
+                logging.warning("Discovery of host {} failed: {}"
+                                .format(host, str(e)))
+                devices.extend(d for d in self.devices if d.host == host)
+                exception = exception or e
+        if [repr(d) for d in devices] != [repr(d) for d in self.devices]:
+            logging.info("Devices discovered: {}".format(devices))
+        self.devices = devices
+        self.__discovered = monotonic()
+        if not devices and exception:
+            raise exception
+
+        return devices
+
+    def _get(
+            self,
+            device: Device
+    ) -> Response:
+        with self.__host_limits[device.host]:
+            device.last_polled = monotonic()
+            content = self.session.get(device.url, timeout=self.timeout)
+        content.raise_for_status()  # HTTP status
+
+        return content
+
+    def __call__(self) -> list[tuple[dict[str, str], Response]]:
+        """
+        poll all devices due concurrently
+        :return: tags and response per device. The first exception is
+        re-raised only if all devices failed
+        """
+
+        if monotonic() - self.__discovered >= self.rediscover_period \
+                or not self.devices:
+            self.discover()
+
+        now = monotonic()
+        due = [device for device in self.devices
+               if now - device.last_polled + _TOLERANCE >= self.min_interval]
+        futures = [(device, self.__executor.submit(self._get, device))
+                   for device in due]
+        contents: list[tuple[dict[str, str], Response]] = list()
+        exception: Exception | None = None
+        for device, future in futures:
+            try:
+                contents.append((device.tags, future.result()))
+                if repr(device) in self.__failed:
+                    logging.info("Device {} recovered".format(device))
+                    self.__failed.discard(repr(device))
+            except (Exception,) as e:
+                if repr(device) not in self.__failed:
+                    logging.warning("Device {} failed: {}"
+                                    .format(device, str(e)))
+                    self.__failed.add(repr(device))
+                exception = exception or e
+        if futures and not contents and exception:
+            raise exception
+
+        return contents
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
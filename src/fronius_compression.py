@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+"""
+fronius_compression.py
+
+change-only compression of fields before being written to influxDB,
+configurable per measurement and field (or "*" for all other fields of a
+measurement):
+
+"deadband": a value is written if it deviates from the value last written
+by more than "deviation" (any change if 0). Non-numeric values are written
+on change.
+"swinging_door": a value is archived if the line from the last archived
+value can no longer pass within +/- "deviation" through all values in
+between. The value preceding the violation is written then with its own
+timestamp, such that the series is reconstructed by linear interpolation.
+
+Any field is written at least every "heartbeat" seconds. Measurements and
+fields not configured pass unchanged.
+"""
+from datetime import datetime, timezone
+from typing import Any
+
+_DEADBAND = "deadband"
+_SWINGING_DOOR = "swinging_door"
+
+
+class _FieldState(object):
+    __slots__ = ('t0', 'v0', 'held_t', 'held_v', 'held_time',
+                 'slope_up', 'slope_low')
+
+    def __init__(
+            self,
+            t: float,
+            v: Any
+    ) -> None:
+        self.t0, self.v0 = t, v  # last written
+        self.held_t: float | None = None  # last seen, not written
+        self.held_v: Any = None
+        self.held_time: Any = None  # its original timestamp
+        self.slope_up: float = float('inf')
+        self.slope_low: float = float('-inf')
+
+
+class Compression(object):
+    def __init__(
+            self,
+            *,
+            measurements: dict[str, dict[str, dict]],
+            heartbeat: float = 300.
+    ) -> None:
+        """
+        :param measurements: measurement -> field (or "*") ->
+        {"method": [deadband|swinging_door], "deviation": float}
+        :param heartbeat: max. seconds between two writes of any field
+        """
+
+        self.measurements = measurements
+        self.heartbeat = heartbeat
+        self.__states: dict[tuple, _FieldState] = dict()
+        self.__last_time: Any = None
+        self.__last_t: float = 0.
+        # metrics
+        self.fields_in: int = 0
+        self.fields_out: int = 0
+
+    def _seconds(
+            self,
+            time: str | datetime
+    ) -> float:
+        """
+        timestamp in seconds since epoch, shared by many records of a poll
+        :param time:
+        :return:
+        """
+
+        if time != self.__last_time:
+            dt = time if isinstance(time, datetime) \
+                else datetime.fromisoformat(time)
+            if dt.tzinfo is None:  # naive, assumed UTC
+                dt = dt.replace(tzinfo=timezone.utc)
+            self.__last_time, self.__last_t = time, dt.timestamp()
+
+        return self.__last_t
+
+    def _field(
+            self,
+            key: tuple,
+            config: dict,
+            t: float,
+            time: Any,
+            v: Any,
+            held: dict[Any, dict]
+    ) -> bool:
+        """
+        compress one field value
+        :param key: measurement, tags and field
+        :param config: method and deviation
+        :param t: timestamp in seconds
+        :param time: original timestamp
+        :param v: value
+        :param held: collects held values to be written by their timestamp
+        :return: True, if value is to be written at t
+        """
+
+        state = self.__states.get(key)
+        if state is None:
+            self.__states[key] = _FieldState(t, v)
+            return True
+        numeric = isinstance(v, (int, float)) and not isinstance(v, bool)
+        deviation = config.get('deviation', 0.)
+
+        if t - state.t0 >= self.heartbeat:
+            # write anyhow, archive the value held by the door before, such
+            # that the values it covered stay within deviation
+            if state.held_t is not None:
+                held.setdefault(state.held_time, dict())[key[2]] = \
+                    state.held_v
+        elif not numeric or not isinstance(state.v0, (int, float)):
+            if v == state.v0:
+                return False
+        elif config.get('method', _DEADBAND) == _SWINGING_DOOR:
+            dt = t - state.t0
+            if dt <= 0:
+                return False
+            slope_up = min(state.slope_up, (v + deviation - state.v0) / dt)
+            slope_low = max(state.slope_low, (v - deviation - state.v0) / dt)
+            if slope_low <= slope_up:  # door still closed
+                state.slope_up, state.slope_low = slope_up, slope_low
+                state.held_t, state.held_v, state.held_time = t, v, time
+                return False
+            if state.held_t is not None:
+                # archive the value held, restart the door from there
+                held.setdefault(state.held_time, dict())[key[2]] = \
+                    state.held_v
+                state.t0, state.v0 = state.held_t, state.held_v
+                state.held_t = None
+                dt = t - state.t0
+                state.slope_up = (v + deviation - state.v0) / dt
+                state.slope_low = (v - deviation - state.v0) / dt
+                state.held_t, state.held_v, state.held_time = t, v, time
+                return False
+        elif abs(v - state.v0) <= deviation:
+            return False
+
+        state.t0, state.v0 = t, v
+        state.held_t = None
+        state.slope_up, state.slope_low = float('inf'), float('-inf')
+        return True
+
+    def __call__(
+            self,
+            records: list[dict]
+    ) -> list[dict]:
+        """
+        compress records
+        :param records:
+        :return: records comprising the fields to be written
+        """
+
+        result: list[dict] = list()
+        for record in records:
+            config = self.measurements.get(record['measurement'])
+            if config is None:
+                result.append(record)
+                continue
+            tags = record.get('tags')
+            prefix = (record['measurement'],
+                      tuple(tags.items()) if tags else None)
+            time = record['time']
+            t = self._seconds(time)
+            held: dict[Any, dict] = dict()
+            fields: dict[str, Any] = dict()
+            for name, value in record['fields'].items():
+                self.fields_in += 1
+                field_config = config.get(name, config.get('*'))
+                if field_config is None or value is None:
+                    fields[name] = value
+                elif self._field(prefix + (name,), field_config, t, time,
+                                 value, held):
+                    fields[name] = value
+            for held_time, held_fields in held.items():
+                result.append(self._record(record, held_time, held_fields))
+            if fields:
+                result.append(self._record(record, time, fields))
+
+        return result
+
+    def flush(self) -> list[dict]:
+        """
+        values held by swinging door, e.g. at shutdown
+        :return: records
+        """
+
+        result: dict[tuple, dict] = dict()
+        for (measurement, tags, name), state in self.__states.items():
+            if state.held_t is not None:
+                result.setdefault(
+                    (measurement, tags, state.held_time),
+                    dict())[name] = state.held_v
+                state.held_t = None
+
+        return [
+            self._record(
+                {'measurement': measurement,
+                 'tags': dict(tags) if tags else None},
+                time,
+                fields)
+            for (measurement, tags, time), fields in result.items()
+        ]
+
+    def _record(
+            self,
+            record: dict,
+            time: Any,
+            fields: dict[str, Any]
+    ) -> dict:
+        self.fields_out += len(fields)
+        result = {
+            'measurement': record['measurement'],
+            'time': time,
+            'fields': fields
+        }
+        if record.get('tags'):
+            result['tags'] = record['tags']
+
+        return result
+
+    def __str__(self) -> str:
+        return "Compression: {} of {} fields written ({:.1f}%)".format(
+            self.fields_out,
+            self.fields_in,
+            self.fields_out / self.fields_in * 100 if self.fields_in else 0.)
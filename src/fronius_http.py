@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""
+fronius_http.py
+
+fetches the Fronius Solar API endpoints over one shared keep-alive session,
+either concurrently (one thread per endpoint) or one after another. The
+session pools its connections and retries failed requests with backoff, in
+order to spare the inverter's embedded web server.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer
+from typing import Iterable
+
+import requests
+from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def inverter_session(
+        *,
+        pool_connections: int = 1,
+        pool_maxsize: int = 3,
+        retries: int = 2,
+        backoff_factor: float = 0.3,
+        status_forcelist: Iterable[int] = (500, 502, 503, 504),
+        **kwargs
+) -> requests.Session:
+    """
+    create a keep-alive session with a connection pool and retry policy
+    for the inverter's Solar API
+    :param pool_connections: no of hosts to keep connection pools for
+    :param pool_maxsize: max. no of connections kept alive per host
+    :param retries: max. no of retries on connect, read or status errors
+    :param backoff_factor: sleep backoff_factor * 2 ** (retry - 1) seconds
+    between retries
+    :param status_forcelist: HTTP status codes that enforce a retry
+    :param kwargs: any other parameter is ignored
+    :return: session
+    """
+
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=tuple(status_forcelist),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False  # leave to raise_for_status()
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=retry,
+        pool_block=False
+    )
+    session = requests.Session()
+    session.headers.update({"Connection": "keep-alive"})
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def timeout_from_parameter(
+        value: float | list[float] | None
+) -> float | tuple[float, float] | None:
+    """
+    timeout as provided in parameter.json: either one value for both
+    connect and read or a list [connect, read] in seconds
+    :param value:
+    :return: timeout as accepted by requests
+    """
+
+    if isinstance(value, (list, tuple)):
+        return float(value[0]), float(value[1])
+    return value
+
+
+class EndpointFetcher(object):
+    def __init__(
+            self,
+            *,
+            endpoints: Iterable[str],
+            session: requests.Session | None = None,
+            timeout: float | tuple[float, float] = 4.,
+            concurrent: bool = True
+    ) -> None:
+        """
+        :param endpoints: urls to be requested each cycle
+        :param session: shared session, a plain one is created if None
+        :param timeout: timeout of each GET request in seconds
+        :param concurrent: GET all endpoints in parallel, if True
+        """
+
+        self.endpoints: list[str] = list(endpoints)
+        self.session = session if session else requests.Session()
+        self.timeout = timeout
+        self.concurrent = concurrent
+        # latency of the most recent GET request per url in ms
+        self.latency: dict[str, float] = dict()
+        self.__executor: ThreadPoolExecutor | None = ThreadPoolExecutor(
+            max_workers=len(self.endpoints),
+            thread_name_prefix="fronius"
+        ) if concurrent else None
+
+    def _get(
+            self,
+            url: str
+    ) -> Response:
+        """
+        GET one endpoint and record its latency
+        :param url:
+        :return: response
+        """
+
+        start_time = default_timer()
+        try:
+            content = self.session.get(url, timeout=self.timeout)
+        finally:
+            self.latency[url] = (default_timer() - start_time) * 1_000
+        content.raise_for_status()  # HTTP status
+
+        return content
+
+    def __call__(self) -> list[Response]:
+        """
+        GET all endpoints, responses are returned in order of the endpoints.
+        The first exception raised by any of the requests is re-raised.
+        :return: responses
+        """
+
+        start_time = default_timer()
+        if self.__executor:
+            futures = [self.__executor.submit(self._get, url)
+                       for url in self.endpoints]
+            contents = [future.result() for future in futures]
+        else:
+            contents = [self._get(url) for url in self.endpoints]
+        logging.debug(
+            "Time consumed for GET endpoints: {0:.2f} ms, "
+            "latency per endpoint: {1}".format(
+                (default_timer() - start_time) * 1_000,
+                ", ".join("{0:.2f} ms".format(self.latency[url])
+                          for url in self.endpoints)))
+
+        return contents
+
+    def close(self) -> None:
+        if self.__executor:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+"""
+fronius_lineprotocol.py
+
+encodes records, as prepared by translate_response and sun_parameter, to
+influxDB line protocol bytes directly. Escaped measurement/tag prefixes and
+field keys are precomputed once per measurement and cached thereafter, such
+that the costly round trip via influxdb_client's Point is skipped.
+
+Run as script for a benchmark against Point.from_dict:
+    PYTHONPATH=. python3 src/fronius_lineprotocol.py
+"""
+import numbers
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_PRECISION: dict[str, timedelta] = {
+    "s": timedelta(seconds=1),
+    "ms": timedelta(milliseconds=1),
+    "us": timedelta(microseconds=1)
+}
+_ESCAPE_MEASUREMENT = str.maketrans(
+    {",": "\\,", " ": "\\ ", "\n": "\\n"})
+_ESCAPE_KEY = str.maketrans(
+    {",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n"})
+
+
+class LineProtocolEncoder(object):
+    def __init__(
+            self,
+            write_precision: str = "s",
+            measurements: dict[str, Iterable[str]] | None = None
+    ) -> None:
+        """
+        :param write_precision: [s|ms|us|ns]
+        :param measurements: measurements and their field keys to be
+        precomputed, others are added on first occurrence
+        """
+
+        assert write_precision in ("s", "ms", "us", "ns"), \
+            "Write precision: [s|ms|us|ns]"
+        self.write_precision = write_precision
+        self.__prefixes: dict[tuple, bytes] = dict()
+        self.__field_keys: dict[str, bytes] = dict()
+        # timestamps are shared by many records of one cycle
+        self.__last_time: Any = None
+        self.__last_timestamp: bytes = b""
+        for measurement, fields in (measurements or {}).items():
+            self._prefix(measurement, None)
+            for field in fields:
+                self._field_key(field)
+
+    def _prefix(
+            self,
+            measurement: str,
+            tags: dict[str, str] | None
+    ) -> bytes:
+        """
+        escaped measurement and tag set, trailed by a blank
+        :param measurement:
+        :param tags:
+        :return:
+        """
+
+        key = (measurement, tuple(tags.items()) if tags else None)
+        try:
+            return self.__prefixes[key]
+        except KeyError:
+            prefix = measurement.translate(_ESCAPE_MEASUREMENT)
+            for k, v in sorted((tags or {}).items()):
+                if v is None or v == "":
+                    continue
+                prefix += ",{}={}".format(str(k).translate(_ESCAPE_KEY),
+                                          str(v).translate(_ESCAPE_KEY))
+            self.__prefixes[key] = (prefix + " ").encode()
+            return self.__prefixes[key]
+
+    def _field_key(
+            self,
+            field: str
+    ) -> bytes:
+        try:
+            return self.__field_keys[field]
+        except KeyError:
+            self.__field_keys[field] = \
+                (field.translate(_ESCAPE_KEY) + "=").encode()
+            return self.__field_keys[field]
+
+    @staticmethod
+    def _value(value: Any) -> bytes | None:
+        """
+        field value in line protocol, exact types first as the most common.
+        Numbers of other types, e.g. numpy scalars, are converted to int or
+        float
+        :param value:
+        :return:
+        """
+
+        kind = type(value)
+        if kind is float:
+            if value != value or value in (float("inf"), float("-inf")):
+                return None  # not supported by influxDB
+            return repr(value).encode()
+        if kind is int:
+            return b"%di" % value
+        if kind is bool:
+            return b"true" if value else b"false"
+        if value is None:
+            return None
+        if kind is not str:
+            if isinstance(value, numbers.Integral):
+                return LineProtocolEncoder._value(int(value))
+            if isinstance(value, numbers.Real):
+                # repr of e.g. np.float64 is not plain
+                return LineProtocolEncoder._value(float(value))
+        return ('"' + str(value).replace("\\", "\\\\").replace('"', '\\"')
+                + '"').encode()
+
+    def _timestamp(
+            self,
+            time: str | datetime | int | None
+    ) -> bytes:
+        if time is None:
+            return b""
+        if time == self.__last_time:
+            return self.__last_timestamp
+        if isinstance(time, numbers.Integral):
+            timestamp = b" %d" % int(time)
+        else:
+            dt = time if isinstance(time, datetime) \
+                else datetime.fromisoformat(time)
+            if dt.tzinfo is None:  # naive, assumed UTC
+                dt = dt.replace(tzinfo=timezone.utc)
+            delta = dt - _EPOCH
+            if self.write_precision == "ns":
+                timestamp = b" %d" % (delta // _PRECISION["us"] * 1_000)
+            else:
+                timestamp = b" %d" % (delta // _PRECISION[self.write_precision])
+        self.__last_time, self.__last_timestamp = time, timestamp
+
+        return timestamp
+
+    def encode_record(
+            self,
+            record: dict[str, Any]
+    ) -> bytes | None:
+        """
+        encode one record {'measurement', 'tags' (optional), 'time',
+        'fields'}
+        :param record:
+        :return: one line w/o line feed, None if there is no valid field
+        """
+
+        field_key = self._field_key
+        value_of = self._value
+        fields = b",".join(
+            field_key(k) + v
+            for k, v in ((k, value_of(v)) for k, v in record['fields'].items())
+            if v is not None)
+        if not fields:
+            return None
+
+        return (self._prefix(record['measurement'], record.get('tags'))
+                + fields
+                + self._timestamp(record.get('time')))
+
+    def encode(
+            self,
+            records: Iterable[dict[str, Any]]
+    ) -> bytes:
+        """
+        encode records to line protocol
+        :param records:
+        :return: one record per line
+        """
+
+        return b"\n".join(line for line in map(self.encode_record, records)
+                          if line is not None)
+
+
+if __name__ == "__main__":
+    from timeit import timeit
+
+    from influxdb_client import Point
+
+    timestamp = "2026-06-23T12:00:05+02:00"
+    cycle = [
+        {'measurement': 'DeviceStatus', 'time': timestamp,
+         'fields': {'ErrorCode': 0, 'InverterState': 'Running',
+                    'StatusCode': 7}},
+        {'measurement': 'CommonInverterData', 'time': timestamp,
+         'fields': {k: 1234.5 for k in (
+             'PAC', 'SAC', 'IAC', 'UAC', 'FAC', 'IDC', 'IDC_2', 'UDC',
+             'UDC_2', 'DAY_ENERGY', 'YEAR_ENERGY', 'TOTAL_ENERGY')}},
+        {'measurement': 'Battery', 'time': timestamp,
+         'fields': {'Current_DC': -1.5, 'Enable': 1,
+                    'StateOfCharge_Relative': 87.0,
+                    'Status_BatteryCell': 3.0, 'Temperature_Cell': 24.5,
+                    'Voltage_DC': 412.3}},
+        {'measurement': 'SmartMeter', 'time': timestamp,
+         'fields': {k: 230.1 for k in (
+             'PowerReal_P_Sum', 'PowerReal_P_Phase_1', 'PowerReal_P_Phase_2',
+             'PowerReal_P_Phase_3', 'Current_AC_Sum', 'Current_AC_Phase_1',
+             'Current_AC_Phase_2', 'Current_AC_Phase_3',
+             'Voltage_AC_Phase_1', 'Voltage_AC_Phase_2',
+             'Voltage_AC_Phase_3')} | {'Enable': 1, 'Visible': 1}},
+        {'measurement': 'SolarData', 'time': "2026-06-23T10:00:05+00:00",
+         'fields': {'sun_elevation': 55.1, 'sun_azimuth': 180.2,
+                    'air_mass': 1.2, 'atmospheric_attenuation': 0.7,
+                    '1_intensity_corr_area_eff': 3100.2,
+                    '1_incidence_ratio': 0.8,
+                    '2_intensity_corr_area_eff': 1900.7,
+                    '2_incidence_ratio': 0.4}}
+    ]
+    encoder = LineProtocolEncoder(write_precision="s")
+    number = 2_000
+
+    t_point = timeit(
+        lambda: "\n".join(Point.from_dict(record, write_precision="s")
+                          .to_line_protocol() for record in cycle).encode(),
+        number=number)
+    t_encoder = timeit(lambda: encoder.encode(cycle), number=number)
+    print(encoder.encode(cycle).decode())
+    print("Point.from_dict: {0:.1f} µs/cycle, "
+          "LineProtocolEncoder: {1:.1f} µs/cycle, gain: {2:.1f}x".format(
+        t_point / number * 1e6,
+        t_encoder / number * 1e6,
+        t_point / t_encoder))
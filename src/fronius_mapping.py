@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+"""
+fronius_mapping.py
+
+declarative mapping of Fronius Solar API responses to influxDB records, as
+defined in data/mapping.json. The mapping is compiled once at startup into
+extractor callables per data collection and device model:
+
+"collections": responses with a DataCollection in their request arguments
+"models": responses identified by the device model found at "model_path"
+
+Each record is defined by its "measurement", the "path" below Body.Data and
+its "fields", each field being [type, default] with type
+    "value": Fronius value object {"Value": ..., "Unit": ...}, float
+    "float": plain number, float
+    "raw": taken as is
+Default applies, if the field is missing or null. Adding a device requires
+an entry in mapping.json solely.
+"""
+import json
+from typing import Any, Callable
+
+
+def _value(v: Any, default: Any) -> Any:
+    if v is None:
+        return default
+    v = v.get('Value')
+    return default if v is None else float(v)
+
+
+def _float(v: Any, default: Any) -> Any:
+    return default if v is None else float(v)
+
+
+def _raw(v: Any, default: Any) -> Any:
+    return default if v is None else v
+
+
+_CONVERTERS: dict[str, Callable[[Any, Any], Any]] = {
+    "value": _value,
+    "float": _float,
+    "raw": _raw
+}
+
+Extractor = Callable[[dict, str], dict[str, Any]]
+
+
+def compile_record(
+        *,
+        measurement: str,
+        path: list[str],
+        fields: dict[str, list]
+) -> Extractor:
+    """
+    compile one record definition into an extractor
+    :param measurement: influxDB measurement
+    :param path: keys below Body.Data
+    :param fields: field name -> [type, default]
+    :return: extractor(data, timestamp) -> record
+    """
+
+    path = tuple(path)
+    specs = tuple((name, _CONVERTERS[kind], default)
+                  for name, (kind, default) in fields.items())
+
+    def extract(
+            data: dict,
+            timestamp: str
+    ) -> dict[str, Any]:
+        for key in path:
+            data = data[key]
+        get = data.get
+        return {
+            'measurement': measurement,
+            'time': timestamp,
+            'fields': {name: convert(get(name), default)
+                       for name, convert, default in specs}
+        }
+
+    return extract
+
+
+class MappingRegistry(object):
+    def __init__(
+            self,
+            mapping: dict
+    ) -> None:
+        """
+        :param mapping: as read from mapping.json
+        """
+
+        self.collections: dict[str, tuple[Extractor, ...]] = {
+            collection: tuple(compile_record(**record) for record in records)
+            for collection, records in mapping.get('collections', {}).items()
+        }
+        self.models: dict[str, tuple[Extractor, ...]] = {
+            model: tuple(compile_record(**record)
+                         for record in value['records'])
+            for model, value in mapping.get('models', {}).items()
+        }
+        # distinct paths to look up the device model
+        self.model_paths: tuple[tuple[str, ...], ...] = tuple({
+            tuple(value['model_path'])
+            for value in mapping.get('models', {}).values()
+        })
+
+    @classmethod
+    def from_file(
+            cls,
+            file: str
+    ) -> "MappingRegistry":
+        with open(file, 'r') as f:
+            return cls(json.load(f))
+
+    def _model(
+            self,
+            data: dict
+    ) -> str | None:
+        """
+        device model at any of the model paths
+        :param data: Body.Data
+        :return: model, if registered
+        """
+
+        for path in self.model_paths:
+            item: Any = data
+            for key in path:
+                item = item.get(key) if isinstance(item, dict) else None
+            if item in self.models:
+                return item
+
+        return None
+
+    def extractors(
+            self,
+            collection: str | None,
+            data: dict
+    ) -> tuple[Extractor, ...] | None:
+        """
+        extractors of a response
+        :param collection: DataCollection of request arguments, if any
+        :param data: Body.Data
+        :return: extractors, None if neither collection nor model registered
+        """
+
+        if collection is not None:
+            return self.collections.get(collection)
+        model = self._model(data)
+
+        return self.models[model] if model else None
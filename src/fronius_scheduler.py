@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+"""
+fronius_scheduler.py
+
+fires polls on a fixed grid of wall-clock ticks, i.e. at multiples of the
+interval since the epoch, while deadlines are tracked on the monotonic clock.
+Ticks missed while the loop overran are skipped and counted, the lateness
+of each wake-up (jitter) is summarized periodically.
+
+AdaptivePolling decides on how many ticks to wait for the next poll: fewer
+on fast changes of power, more at low sun elevation or steady power.
+"""
+import logging
+import math
+from time import monotonic, sleep, time
+
+
+class TickScheduler(object):
+    def __init__(
+            self,
+            *,
+            interval: float,
+            report_period: float = 3_600.
+    ) -> None:
+        """
+        :param interval: period of time between two ticks in seconds
+        :param report_period: log jitter statistics every report_period
+        seconds
+        """
+
+        self.interval = interval
+        self.report_period = report_period
+        self.overruns: int = 0  # no of cycles that exceeded the interval
+        self.skipped: int = 0  # no of ticks skipped owing to overruns
+        self.__last_report: float = monotonic()
+        # running jitter statistics (Welford)
+        self.__count: int = 0
+        self.__mean: float = 0.
+        self.__m2: float = 0.
+        self.__max: float = 0.
+        # next tick on monotonic clock: first tick is due right away, the
+        # subsequent ones on the grid
+        self.__deadline: float = self._next_tick() - self.interval
+
+    def _next_tick(
+            self,
+            delay: float = 0.
+    ) -> float:
+        """
+        monotonic time of the first wall-clock tick at or after now + delay
+        :param delay: seconds
+        :return: deadline
+        """
+
+        now_wall, now_mono = time(), monotonic()
+        tick_wall = math.ceil((now_wall + delay) / self.interval) * self.interval
+
+        return now_mono + tick_wall - now_wall
+
+    def _sleep_until(
+            self,
+            deadline: float
+    ) -> None:
+        remaining = deadline - monotonic()
+        if remaining > 0:
+            sleep(remaining)
+
+    def resync(
+            self,
+            delay: float = 0.
+    ) -> None:
+        """
+        wait for the first tick at or after now + delay, e.g. after a retry
+        period, with no overrun counted
+        :param delay: seconds
+        :return:
+        """
+
+        self.__deadline = self._next_tick(delay)
+        self._sleep_until(self.__deadline)
+
+    def wait(
+            self,
+            ticks: int = 1
+    ) -> int:
+        """
+        wait for the next tick or the tick after next ... If the deadline
+        has already passed, missed ticks are skipped and flagged
+        :param ticks: no of ticks to wait for
+        :return: no of ticks elapsed since the previous poll
+        """
+
+        self.__deadline += ticks * self.interval
+        lateness = monotonic() - self.__deadline
+        if lateness > 0:  # overrun
+            missed = math.floor(lateness / self.interval) + 1
+            self.__deadline += missed * self.interval
+            self.overruns += 1
+            self.skipped += missed
+            ticks += missed
+            logging.debug("Cycle overran by {0:.2f} s, skipping {1} tick(s)"
+                          .format(lateness, missed))
+        self._sleep_until(self.__deadline)
+        self._update(monotonic() - self.__deadline)
+
+        return ticks
+
+    def _update(
+            self,
+            jitter: float
+    ) -> None:
+        """
+        update jitter statistics and report them periodically
+        :param jitter: lateness of wake-up in seconds
+        :return:
+        """
+
+        self.__count += 1
+        delta = jitter - self.__mean
+        self.__mean += delta / self.__count
+        self.__m2 += delta * (jitter - self.__mean)
+        self.__max = max(self.__max, jitter)
+
+        if monotonic() - self.__last_report >= self.report_period:
+            logging.info(self)
+            self.__last_report = monotonic()
+
+    @property
+    def statistics(self) -> dict[str, float | int]:
+        return {
+            "polls": self.__count,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "jitter_mean_ms": self.__mean * 1_000,
+            "jitter_max_ms": self.__max * 1_000,
+            "jitter_std_ms": math.sqrt(self.__m2 / self.__count) * 1_000
+            if self.__count else 0.
+        }
+
+    def __str__(self) -> str:
+        return ("Scheduler: {polls} polls, {overruns} overruns, "
+                "{skipped} ticks skipped, jitter mean {jitter_mean_ms:.2f} ms, "
+                "max {jitter_max_ms:.2f} ms, std {jitter_std_ms:.2f} ms"
+                .format(**self.statistics))
+
+
+class AdaptivePolling(object):
+    # power readings (inverter AC, meter sum) to detect transients
+    POWER_FIELDS: tuple[str, ...] = ('PAC', 'PowerReal_P_Sum')
+
+    def __init__(
+            self,
+            *,
+            max_ticks: int = 6,
+            night_ticks: int = 12,
+            low_elevation: float = 10.,
+            steady_threshold: float = 50.,
+            fast_threshold: float = 300.
+    ) -> None:
+        """
+        :param max_ticks: max. no of ticks between polls at daytime
+        :param night_ticks: no of ticks between polls with sun below horizon
+        :param low_elevation: sun elevation in degrees, below which polling
+        slows down
+        :param steady_threshold: change of power in W, below which power is
+        considered steady
+        :param fast_threshold: change of power in W, above which polling
+        returns to every tick
+        """
+
+        self.max_ticks = max_ticks
+        self.night_ticks = night_ticks
+        self.low_elevation = low_elevation
+        self.steady_threshold = steady_threshold
+        self.fast_threshold = fast_threshold
+        self.ticks: int = 1
+        self.__previous: dict[str, float] = dict()
+
+    def __call__(
+            self,
+            *,
+            elevation: float | None,
+            records: list[dict]
+    ) -> int:
+        """
+        no of ticks to wait for the next poll
+        :param elevation: sun elevation in degrees, None if unknown
+        :param records: records of current poll comprising power readings
+        :return: ticks
+        """
+
+        power: dict[str, float] = {
+            "{}:{}:{}".format(record['measurement'], key, record.get('tags')):
+                record['fields'][key]
+            for record in records
+            for key in self.POWER_FIELDS
+            if key in record['fields']
+        }
+        change = max((abs(value - self.__previous[key])
+                      for key, value in power.items()
+                      if key in self.__previous), default=0.)
+        self.__previous = power
+
+        if change >= self.fast_threshold:
+            self.ticks = 1  # transient, back to full resolution
+        elif elevation is not None and elevation <= 0:
+            self.ticks = self.night_ticks
+        elif ((elevation is not None and elevation < self.low_elevation)
+              or change < self.steady_threshold):
+            self.ticks = min(self.ticks * 2, self.max_ticks)  # slow down
+        else:
+            self.ticks = max(self.ticks // 2, 1)  # speed up
+
+        return self.ticks
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+"""
+fronius_spool.py
+
+durable on-disk spool for line-protocol batches that could not be written
+to InfluxDB. Batches are kept in a SQLite database in WAL mode, bounded in
+size (oldest batches are evicted first) and replayed oldest first.
+"""
+import logging
+import os
+import sqlite3
+from time import time
+
+
+class Spool(object):
+    def __init__(
+            self,
+            *,
+            path: str,
+            max_size: int = 50_000_000
+    ) -> None:
+        """
+        :param path: SQLite database file, directory is created if missing
+        :param max_size: max. size of all spooled batches in bytes
+        """
+
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # connection is used by the writer thread solely
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created REAL NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "lines BLOB NOT NULL)")
+        self.__connection.commit()
+        self.evicted: int = 0  # no of batches evicted owing to max_size
+
+    def __len__(self) -> int:
+        return self.__connection.execute(
+            "SELECT COUNT(*) FROM batches").fetchone()[0]
+
+    @property
+    def size(self) -> int:
+        return self.__connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM batches").fetchone()[0]
+
+    def append(
+            self,
+            lines: bytes
+    ) -> None:
+        """
+        append one batch and evict the oldest batches beyond max_size
+        :param lines: line protocol, one record per line
+        :return:
+        """
+
+        with self.__connection:
+            self.__connection.execute(
+                "INSERT INTO batches (created, size, lines) VALUES (?, ?, ?)",
+                (time(), len(lines), lines))
+            excess = self.size - self.max_size
+            while excess > 0:
+                row = self.__connection.execute(
+                    "SELECT id, size FROM batches ORDER BY id LIMIT 1"
+                ).fetchone()
+                self.__connection.execute(
+                    "DELETE FROM batches WHERE id = ?", (row[0],))
+                excess -= row[1]
+                if self.evicted == 0:
+                    logging.warning("Spool exceeds {} bytes, evicting oldest "
+                                    "batches ...".format(self.max_size))
+                self.evicted += 1
+
+    def oldest(
+            self,
+            limit: int
+    ) -> tuple[list[int], bytes]:
+        """
+        oldest batches combined
+        :param limit: max. no of batches
+        :return: ids of batches, line protocol
+        """
+
+        rows = self.__connection.execute(
+            "SELECT id, lines FROM batches ORDER BY id LIMIT ?",
+            (limit,)).fetchall()
+
+        return [row[0] for row in rows], b"\n".join(row[1] for row in rows)
+
+    def remove(
+            self,
+            ids: list[int]
+    ) -> None:
+        with self.__connection:
+            self.__connection.executemany(
+                "DELETE FROM batches WHERE id = ?", [(i,) for i in ids])
+
+    def close(self) -> None:
+        self.__connection.close()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+"""
+fronius_writer.py
+
+background writer stage for InfluxDB: records are handed over to a bounded
+queue by the polling loop and written in batches by a separate thread,
+flushed by size or age. Failed writes are retried with jittered exponential
+backoff. If the queue is full, the drop policy applies, so the polling loop
+never waits on the database (unless explicitly configured to block).
+Batches that still fail are kept in an optional on-disk spool and replayed
+oldest first once influxDB is back.
+"""
+import logging
+import random
+import threading
+from enum import Enum
+from queue import Queue, Empty, Full
+from timeit import default_timer
+
+from influxdb_client.client.write_api import WriteApi, WritePrecision
+
+# internal
+from src.fronius_lineprotocol import LineProtocolEncoder
+from src.fronius_spool import Spool
+
+
+class DropPolicy(str, Enum):
+    DROP_OLDEST = "drop_oldest"  # discard oldest queued record
+    DROP_NEWEST = "drop_newest"  # discard record to be queued
+    BLOCK = "block"  # back-pressure: block for block_timeout, then drop newest
+
+
+class InfluxWriter(threading.Thread):
+    def __init__(
+            self,
+            *,
+            write_api: WriteApi,
+            bucket: str,
+            org: str,
+            queue_size: int = 10_000,
+            batch_size: int = 1_000,
+            flush_interval: float = 60.,
+            max_retries: int = 5,
+            retry_interval: float = 5.,
+            max_retry_delay: float = 125.,
+            drop_policy: str = DropPolicy.DROP_OLDEST,
+            block_timeout: float = 1.,
+            dry_run: bool = False,
+            write_precision: str = WritePrecision.S,
+            report_period: float = 3_600.,
+            spool: Spool | None = None,
+            replay_batches: int = 20,
+            replay_chunks: int = 10
+    ) -> None:
+        """
+        :param write_api: synchronous write API, used by writer thread solely
+        :param bucket: influxDB bucket
+        :param org: influxDB organization
+        :param queue_size: max. no of records queued
+        :param batch_size: flush if no of records in batch is reached
+        :param flush_interval: flush if oldest record in batch reached this
+        age in seconds
+        :param max_retries: max. no of retries of a failed batch
+        :param retry_interval: delay of first retry in seconds
+        :param max_retry_delay: upper limit of delay between retries
+        :param drop_policy: see DropPolicy
+        :param block_timeout: seconds to block with DropPolicy.BLOCK
+        :param dry_run: if True, nothing is written
+        :param write_precision: precision of timestamps
+        :param report_period: log metrics every report_period seconds
+        :param spool: keeps batches that failed, if provided
+        :param replay_batches: no of spooled batches combined to one write
+        :param replay_chunks: max. no of such writes per replay
+        """
+
+        super().__init__(name="influx-writer", daemon=True)
+        self.write_api = write_api
+        self.bucket = bucket
+        self.org = org
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.max_retry_delay = max_retry_delay
+        self.drop_policy = DropPolicy(drop_policy)
+        self.block_timeout = block_timeout
+        self.dry_run = dry_run
+        self.write_precision = write_precision
+        self.encoder = LineProtocolEncoder(write_precision=write_precision)
+        self.report_period = report_period
+        self.spool = spool
+        self.replay_batches = replay_batches
+        self.replay_chunks = replay_chunks
+        self.__spool_pending: bool = bool(spool is not None and len(spool))
+        self.__replay_failures: int = 0
+        self.__replay_after: float = 0.
+        self.__last_report: float = default_timer()
+        self.__queue: Queue = Queue(maxsize=queue_size)
+        self.__stop = threading.Event()
+        # metrics
+        self.written: int = 0  # no of records written
+        self.dropped: int = 0  # no of records dropped on full queue
+        self.discarded: int = 0  # no of records discarded after retries
+        self.retries: int = 0  # no of retries in total
+        self.max_depth: int = 0  # high-water mark of queue
+        self.spooled: int = 0  # no of records spooled
+        self.replayed: int = 0  # no of records replayed from spool
+
+    def put(
+            self,
+            records: list[dict]
+    ) -> None:
+        """
+        hand over records to the writer thread, applying the drop policy if
+        the queue is full
+        :param records:
+        :return:
+        """
+
+        for record in records:
+            try:
+                if self.drop_policy is DropPolicy.BLOCK:
+                    self.__queue.put(record, timeout=self.block_timeout)
+                else:
+                    self.__queue.put_nowait(record)
+            except Full:
+                if self.drop_policy is DropPolicy.DROP_OLDEST:
+                    try:
+                        self.__queue.get_nowait()
+                    except Empty:
+                        pass
+                    try:
+                        self.__queue.put_nowait(record)
+                    except Full:
+                        pass
+                if self.dropped == 0:
+                    logging.warning("Writer queue is full, dropping records "
+                                    "({}) ...".format(self.drop_policy.value))
+                self.dropped += 1
+        self.max_depth = max(self.max_depth, self.__queue.qsize())
+
+    def run(self) -> None:
+        """
+        collect records from the queue and flush by size or age
+        :return:
+        """
+
+        batch: list[dict] = []
+        batch_started: float = 0.
+
+        while True:
+            stopping = self.__stop.is_set()
+            if stopping and self.__queue.empty():
+                break
+            timeout = (batch_started + self.flush_interval - default_timer()
+                       if batch else self.flush_interval)
+            try:
+                # wake up at least every second to check for close()
+                record = self.__queue.get(timeout=min(max(timeout, 0.), 1.))
+                if not batch:
+                    batch_started = default_timer()
+                batch.append(record)
+            except Empty:
+                if self.__spool_pending:
+                    self._replay()
+            if batch and (len(batch) >= self.batch_size
+                          or default_timer() - batch_started
+                          >= self.flush_interval
+                          or (stopping and self.__queue.empty())):
+                self._flush(batch)
+                batch = []
+                if default_timer() - self.__last_report >= self.report_period:
+                    logging.info(self)
+                    self.__last_report = default_timer()
+        if batch:
+            self._flush(batch)
+
+    def _flush(
+            self,
+            batch: list[dict]
+    ) -> None:
+        """
+        write batch, retry with jittered exponential backoff
+        :param batch:
+        :return:
+        """
+
+        if logging.DEBUG >= logging.root.level:
+            print(batch)
+        if self.dry_run:
+            return
+
+        lines = self._serialize(batch)
+        if not lines:
+            return
+        # influxDB is known to be down or backlog is pending: spool behind
+        # the backlog in order to keep memory bounded, then try to replay
+        if self.__spool_pending:
+            self._to_spool(lines, len(batch))
+            self._replay()
+            return
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                start_time = default_timer()
+                self._write(lines)
+                self.written += len(batch)
+                logging.debug(
+                    "Time consumed for influxDB "
+                    "Sync Write API': {0:.2f} ms, {1}".format(
+                        (default_timer() - start_time) * 1_000, self))
+                return
+            except (Exception,) as e:
+                # no further retries on close(), if the spool keeps the batch
+                if attempt == self.max_retries or (
+                        self.__stop.is_set() and self.spool is not None):
+                    if self.spool is not None:
+                        logging.error("Write failed: {}. {} records spooled."
+                                      .format(str(e), len(batch)))
+                        self._to_spool(lines, len(batch))
+                        return
+                    logging.error("Write failed: {}. {} records discarded."
+                                  .format(str(e), len(batch)))
+                    break
+                # full jitter on exponential backoff
+                delay = random.uniform(
+                    0.,
+                    min(self.max_retry_delay,
+                        self.retry_interval * 2 ** attempt))
+                logging.warning("Write failed: {}. Retrying in {:.1f}s ..."
+                                .format(str(e), delay))
+                self.retries += 1
+                # shortened on close(), a final attempt is made though
+                self.__stop.wait(delay)
+        self.discarded += len(batch)
+
+    def _serialize(
+            self,
+            batch: list[dict]
+    ) -> bytes:
+        """
+        convert records to line protocol
+        :param batch:
+        :return: line protocol, one record per line
+        """
+
+        return self.encoder.encode(batch)
+
+    def _write(
+            self,
+            lines: bytes
+    ) -> None:
+        self.write_api.write(
+            bucket=self.bucket,
+            org=self.org,
+            record=lines,
+            write_precision=self.write_precision
+        )
+
+    def _to_spool(
+            self,
+            lines: bytes,
+            no_records: int
+    ) -> None:
+        self.spool.append(lines)
+        self.spooled += no_records
+        self.__spool_pending = True
+
+    def _replay(self) -> None:
+        """
+        write spooled batches in bulk, oldest first. After a failure, the
+        next replay is deferred by a jittered exponential backoff, such that
+        influxDB is not hammered while being down
+        :return:
+        """
+
+        if default_timer() < self.__replay_after:
+            return
+
+        for _ in range(self.replay_chunks):
+            ids, lines = self.spool.oldest(self.replay_batches)
+            if not ids:
+                self.__spool_pending = False
+                self.__replay_failures = 0
+                logging.info("Spool replayed. {}".format(self))
+                return
+            try:
+                self._write(lines)
+            except (Exception,) as e:
+                delay = random.uniform(
+                    0.,
+                    min(self.max_retry_delay,
+                        self.retry_interval * 2 ** self.__replay_failures))
+                self.__replay_failures += 1
+                self.__replay_after = default_timer() + delay
+                logging.debug("Replay failed: {}. Next attempt in {:.1f}s ..."
+                              .format(str(e), delay))
+                return
+            self.spool.remove(ids)
+            self.replayed += lines.count(b"\n") + 1
+            self.__replay_failures = 0
+
+    def close(
+            self,
+            timeout: float = 10.
+    ) -> None:
+        """
+        flush what is queued and stop the writer thread
+        :param timeout: max. seconds to wait for the final flush
+        :return:
+        """
+
+        self.__stop.set()
+        if self.is_alive():
+            self.join(timeout=timeout)
+        if self.is_alive():
+            # still writing, the spool may yet receive the batch
+            logging.warning("Writer did not finish within {:.1f}s, spool "
+                            "left open".format(timeout))
+        elif self.spool is not None:
+            self.spool.close()
+        logging.info(self)
+
+    @property
+    def metrics(self) -> dict[str, int]:
+        return {
+            "depth": self.__queue.qsize(),
+            "max_depth": self.max_depth,
+            "written": self.written,
+            "dropped": self.dropped,
+            "discarded": self.discarded,
+            "retries": self.retries,
+            "spooled": self.spooled,
+            "replayed": self.replayed
+        }
+
+    def __str__(self) -> str:
+        return ("Writer: queue depth {depth} (max. {max_depth}), "
+                "{written} records written, {dropped} dropped, "
+                "{discarded} discarded, {retries} retries, "
+                "{spooled} spooled, {replayed} replayed"
+                .format(**self.metrics))
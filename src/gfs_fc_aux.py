@@ -1,4 +1,5 @@
 import json
+import logging
 import os
 
 # Logging Format
@@ -15,6 +16,46 @@ with open(config_file, "r") as config_handle:
 DATA_FILE = "{}/forecast_gfs.json".format(DATA_DIR)
 
 STEPS = list(range(0, 121)) + list(range(123, 385, 3))  # 0 step is "anl"
+# peak memory of an extraction worker (pygrib decoding one SLS field)
+WORKER_MEMORY = 256 * 2 ** 20
+NICENESS = 19  # low priority on raspberry Pi
+
 
 def defined_kwargs(**kwargs) -> dict:
     return {k: v for k, v in kwargs.items() if v is not None}
+
+
+def pool_size(max_workers: int | None = None) -> int:
+    """
+    no of extraction workers, bounded by cores and by available memory
+    :param max_workers: upper limit, if not None
+    :return: at least 1
+    """
+
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    size = cores
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    size = min(size, available // WORKER_MEMORY)
+                    break
+    except (OSError, ValueError) as e:
+        logging.debug("Available memory unknown: {}".format(e))
+    if max_workers is not None:
+        size = min(size, max_workers)
+
+    return max(size, 1)
+
+
+def init_worker() -> None:
+    """
+    once per extraction worker, replaces renice of each process
+    :return:
+    """
+
+    os.nice(NICENESS - os.nice(0))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+"""
+gfs_fc_cache.py
+
+on-disk cache of NOMADS metadata, i.e. directory listings, index files and
+sizes of grib files, keyed by forecast cycle and step. Index files and sizes
+are immutable once a cycle is published and served from cache without any
+request. Listings change while a cycle is being published, hence they are
+revalidated by conditional requests (ETag/Last-Modified) once older than
+"listing_max_age". Entries of all but the "keep_cycles" most recent cycles
+are evicted.
+"""
+import json
+import logging
+import os
+from time import time
+
+import requests
+
+# internal
+from gfs_fc_aux import DATA_DIR
+
+CACHE_DIR = "{}/cache".format(DATA_DIR)
+
+
+class MetadataCache(object):
+    def __init__(
+            self,
+            *,
+            session: requests.Session,
+            directory: str = CACHE_DIR,
+            listing_max_age: float = 600.,
+            keep_cycles: int = 8
+    ) -> None:
+        """
+        :param session: requests are sent by, if not served from cache
+        :param directory: of the cache files, created if missing
+        :param listing_max_age: seconds a listing is served w/o revalidation
+        :param keep_cycles: no of most recent cycles retained on eviction
+        """
+
+        self.session = session
+        self.directory = directory
+        self.listing_max_age = listing_max_age
+        self.keep_cycles = keep_cycles
+        self.__records: dict[tuple, dict[str, dict]] = dict()
+        # metrics
+        self.hits: int = 0
+        self.revalidated: int = 0
+        self.misses: int = 0
+
+    def _file(
+            self,
+            cycle: str,
+            step: int | None
+    ) -> str:
+        return "{}/{}_{}.json".format(
+            self.directory,
+            cycle,
+            "listing" if step is None else "{:03d}".format(step))
+
+    def _load(
+            self,
+            cycle: str,
+            step: int | None
+    ) -> dict[str, dict]:
+        """
+        :param cycle: YYYYMMDDHH
+        :param step: None for the listing
+        :return: url -> record
+        """
+
+        records = self.__records.get((cycle, step))
+        if records is None:
+            file = self._file(cycle, step)
+            try:
+                with open(file, "r") as f:
+                    records = json.load(f)
+            except FileNotFoundError:
+                records = dict()
+            except (Exception,) as e:
+                logging.warning("Cache file {} discarded: {}".format(file, e))
+                records = dict()
+            self.__records[(cycle, step)] = records
+
+        return records
+
+    def _save(
+            self,
+            cycle: str,
+            step: int | None
+    ) -> None:
+        file = self._file(cycle, step)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = "{}.{}.tmp".format(file, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(self.__records[(cycle, step)], f)
+        os.replace(tmp, file)  # atomic for concurrent runs
+
+    def get(
+            self,
+            url: str,
+            *,
+            cycle: str,
+            step: int | None = None
+    ) -> str:
+        """
+        body of url, index files from cache, listings revalidated
+        :param url:
+        :param cycle: YYYYMMDDHH
+        :param step: forecast hour, None for the listing
+        :return:
+        """
+
+        records = self._load(cycle, step)
+        record = records.get(url)
+        now = time()
+        if (record and 'body' in record
+                and (step is not None
+                     or now - record['fetched'] < self.listing_max_age)):
+            self.hits += 1
+            return record['body']
+
+        headers = dict()
+        if record and record.get('etag'):
+            headers['If-None-Match'] = record['etag']
+        if record and record.get('last_modified'):
+            headers['If-Modified-Since'] = record['last_modified']
+        response = self.session.get(url, headers=headers)
+        if response.status_code == 304 and record and 'body' in record:
+            record['fetched'] = now
+            self.revalidated += 1
+        else:
+            response.raise_for_status()
+            record = {
+                "etag": response.headers.get('ETag'),
+                "last_modified": response.headers.get('Last-Modified'),
+                "fetched": now,
+                "body": response.text
+            }
+            self.misses += 1
+        records[url] = record
+        self._save(cycle, step)
+
+        return record['body']
+
+    def length(
+            self,
+            url: str,
+            *,
+            cycle: str,
+            step: int
+    ) -> int:
+        """
+        size of a grib file by HEAD, from cache if known
+        :param url:
+        :param cycle: YYYYMMDDHH
+        :param step: forecast hour
+        :return: bytes
+        """
+
+        records = self._load(cycle, step)
+        record = records.get(url)
+        if record and 'length' in record:
+            self.hits += 1
+            return record['length']
+
+        response = self.session.head(url, allow_redirects=True)
+        response.raise_for_status()
+        records[url] = {
+            "length": int(response.headers.get("Content-length")),
+            "fetched": time()
+        }
+        self.misses += 1
+        self._save(cycle, step)
+
+        return records[url]['length']
+
+    def evict(self) -> None:
+        """
+        remove entries of all but the most recent cycles
+        :return:
+        """
+
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        cycles = sorted({name.split("_")[0] for name in names
+                         if name.endswith(".json")}, reverse=True)
+        stale = set(cycles[self.keep_cycles:])
+        for name in names:
+            if name.split("_")[0] in stale:
+                os.remove("{}/{}".format(self.directory, name))
+        self.__records = {key: records
+                          for key, records in self.__records.items()
+                          if key[0] not in stale}
+        if stale:
+            logging.debug("Cache: cycles {} evicted".format(sorted(stale)))
+
+    def __str__(self) -> str:
+        return "Metadata cache: {} hits, {} revalidated, {} fetched".format(
+            self.hits, self.revalidated, self.misses)
@@ -9,15 +9,16 @@ according to filter parameters set and stores to temp files in data directory
 import logging
 import os
 from datetime import datetime, timedelta, timezone
-from time import sleep
 
 import requests
 from bs4 import BeautifulSoup
 from multiurl import download
-from requests import Response, HTTPError
+from requests import HTTPError
 
 # internal
 from gfs_fc_aux import DATA_DIR, STEPS
+from gfs_fc_cache import MetadataCache
+from gfs_fc_session import RateLimitedSession
 
 FC_TIMES = [0, 6, 12, 18]
 COMMON = "{_url}/{_model}.{_yyyymmdd}/{_H}/atmos/"
@@ -55,6 +56,8 @@ class Client(object):
             resol="0p25",  # SLS has a resolution of 360 / 1536 !
             paramset="",
             verify=True,
+            rate_limit=None,  # requests_per_minute & burst
+            cache=None,  # listing_max_age & keep_cycles
             **kwargs  # for date & time
     ):
         self.parameter = parameter if parameter else list()
@@ -63,7 +66,11 @@ class Client(object):
         self.resol = resol
         self.paramset = paramset
         self.verify = verify
-        self.session = requests.Session()
+        # every request to NOMADS is rate limited
+        self.session = RateLimitedSession(**(rate_limit or {}))
+        # listings and index files kept on disk across runs
+        self.cache = MetadataCache(session=self.session, **(cache or {}))
+        self.cache.evict()
         self.target = "download.grib2"
         self.date = None
         self.time = None
@@ -118,8 +125,8 @@ class Client(object):
                 rc=False,
                 target=None)
 
-    @staticmethod
     def _get_url_paths(
+            self,
             *,
             url: str,
             ext: str = ".idx",
@@ -132,16 +139,13 @@ class Client(object):
         :param params: not used
         :return:
         """
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        if response.ok:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # list of all downloadable index files per weather forecast time
-            return [url + node.get('href')
-                    for node in soup.find_all('a')
-                    if node.get('href').endswith(ext)]
-        else:
-            return None
+        # listing revalidated, if cached
+        text = self.cache.get(url, cycle=self.cycle)
+        soup = BeautifulSoup(text, 'html.parser')
+        # list of all downloadable index files per weather forecast time
+        return [url + node.get('href')
+                for node in soup.find_all('a')
+                if node.get('href').endswith(ext)]
 
 
     def _check_availability(self) -> None:
@@ -193,6 +197,13 @@ class Client(object):
             self.date = kwargs['date']
             self.time = kwargs['time']
 
+    @property
+    def cycle(self) -> str:
+        """
+        :return: base time of fc YYYYMMDDHH
+        """
+        return "{}{:02d}".format(self.date, self.time)
+
     def _get_url(
             self,
             step: int = None
@@ -230,7 +241,8 @@ class Client(object):
         """
         try:
             idx = self._call_index(
-                url=self._get_url(step=step)
+                url=self._get_url(step=step),
+                step=step
             )
         except (Exception,) as e:
             logging.error(f"Error: {str(e)}, "
@@ -240,12 +252,14 @@ class Client(object):
 
     def _call_index(
             self,
-            url: str
+            url: str,
+            step: int
     ) -> dict[str, dict[int, dict]]:
         """
         extract the index files for offset and length of each parameter layer,
         can be filtered by shortName, level, and type.
         :param url:
+        :param step: forecast hour, key of cache
         :return: index file in dict format
         """
         dix = dict()
@@ -253,22 +267,19 @@ class Client(object):
             ["offset", "datetime", "shortName", "level", "validity"]
 
         try:
-            # total size of grib data file in bytes
-            resp: Response = requests.get(url, stream=True)
-            resp.raise_for_status()
-            length = int(resp.headers.get("Content-length"))
+            # total size of grib data file in bytes, header only
+            length = self.cache.length(url, cycle=self.cycle, step=step)
 
-            # download its appropriate index file
+            # download its appropriate index file, if not cached
             url_index = f"{url}.idx"
-            response = self.session.get(url_index)
-            response.raise_for_status()
+            text = self.cache.get(url_index, cycle=self.cycle, step=step)
             dix[url] = dict()
-            logging.info(f"Index file {str(url_index)} downloaded")
+            logging.info(f"Index file {str(url_index)} retrieved")
         except requests.exceptions.HTTPError as e:
             raise e  # return empty dict for current url
 
-        for line in response.iter_lines():
-            item = line.decode('utf-8').split(":")[:-1]
+        for line in text.splitlines():
+            item = line.split(":")[:-1]
             no = int(item[0])
 
             # convert list to dict by merging lists, skip first element that
@@ -284,17 +295,6 @@ class Client(object):
                     dix[url][no]['offset'] - dix[url][no - 1]['offset']
                 dix[url][no]['length'] = length - dix[url][no]['offset']
 
-        # Caveat:
-        # NOMAD permits a rate limit of <120/minute to their site.
-        # hits are considered to be head/listing commands as well as actual
-        # data download attempts, i.e. every get http request
-        # The block is temporary and typically lasts for 10 minutes
-        # the system is automatically configured to blacklist an IP if it
-        # continually hits the site over the threshold.
-        # source: ncep.pmb.dataflow@noaa.gov (Brian)
-        # Hence, configure the sleep argument accordingly!
-        sleep(2.5)
-
         return dix
 
     def _prepare_request(
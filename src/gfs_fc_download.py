@@ -7,15 +7,13 @@ extract all parameters from temporary data files to dictionary
 """
 import logging
 import os
-from multiprocessing import Queue
 
-import numpy.typing as npt
-import pygrib
 from numpy import array as np_array
-from scipy.interpolate import RegularGridInterpolator
 
 # internal
+from forecast_energy import forecast_sites
 from gfs_fc_aux import CONFIG
+from grib_stream import PointExtractor, messages
 
 
 # def write_forecast(
@@ -43,94 +41,42 @@ from gfs_fc_aux import CONFIG
 #         jsonFile.truncate()
 
 
-def create_grid(
-        coordinates: npt.ArrayLike,
-        lats: npt.ArrayLike,
-        lons: npt.ArrayLike
-) -> dict:
-    """
-    create square in the coordinate grid that encloses location
-    :param coordinates:
-    :param lats:
-    :param lons:
-    :return:
-    """
-    lat1, lat2, lon1, lon2 = -90., 90., 0., 360.
-    # lats scales from 90° to -90°
-    for i in range(len(lats)):
-        if coordinates[0] > lats[i]:
-            lat1 = lats[i]
-            break
-        else:
-            lat2 = lats[i]
-    # longs scales from 0° to 360°  # for GFS, ECMWF ranges from -180° to 180°
-    for i in range(len(lons)):
-        if coordinates[1] < lons[i]:
-            lon2 = lons[i]
-            break
-        else:
-            lon1 = lons[i]
-
-    return {
-        "lat1": lat1,
-        "lat2": lat2,
-        "lon1": lon1,
-        "lon2": lon2
-    }
-
-
 def extract(
         target: str,
-        q: Queue = None,
         keep_target: bool = False
-) -> tuple[bool, dict] | None:
+) -> tuple[str, dict]:
     """
     extract grib2 file according to select parameter
     :param target: full path
-    :param q: queue per fc hour for multiprocessing
     :param keep_target: keep target, if True
-    :return:
+    :return: date of creation, key -> {"unit", "time", "value"}
     """
-    fs: list = list()
     result: dict = dict()
-
-    coords = np_array([CONFIG['location']['latitude'],
-                       (CONFIG['location']['longitude'] + 360) % 360])
-
-    # open grib file
-    fsss = pygrib.open(target)
-    # for i in fsss:
-    #     print(i)
-    #     for j in i.keys():
-    #         print(j, getattr(i,j))
-    fsss.seek(0)
-    item = fsss.read(1)[0]
-    # date of creation
-    date_creation_str = "{}{:04d}".format(
-        item['dataDate'],
-        item['dataTime']
-    )
-    # figure out spatial resolution from 1st item
-    resolution = 360 / item.values.shape[1]  # longitude
-    logging.debug(f"Spatial resolution: {resolution} degree")
-    lats, lons = item.latlons()
-    # place a rectangle over the region to be used for forecast
-    grid = create_grid(coordinates=coords,
-                       lats=lats[:, 0],
-                       lons=lons[0, :])
-
-    fs.extend(fsss.select())
-    fsss.close()
-
-    for item in fs:
+    date_creation_str: str | None = None
+
+    # all sites extracted from each message in one step
+    coords = np_array([[site['location']['latitude'],
+                        (site['location']['longitude'] + 360) % 360]
+                       for _, site in forecast_sites(CONFIG)])
+    if len(coords) == 1:
+        # a single site keeps scalar values in forecast_gfs.json
+        coords = coords[0]
+    # cells enclosing the locations located once per grid definition
+    extractor = PointExtractor(coordinates=coords)
+
+    # messages streamed from grib file, one at a time
+    for item in messages(target):
+        if date_creation_str is None:
+            # date of creation
+            date_creation_str = "{}{:04d}".format(
+                item['dataDate'],
+                item['dataTime']
+            )
+            # figure out spatial resolution from 1st item
+            resolution = 360 / item['Ni']  # longitude
+            logging.debug(f"Spatial resolution: {resolution} degree")
         logging.debug(item["shortName"] + " -> " + str(item))
-        data, lats, lons = item.data(**grid)
-        nearest_neighbor = RegularGridInterpolator(
-            (lats[:, 0], lons[0, :]),
-            data,
-            method='linear'
-        )
-        value_at_coordinates = list(nearest_neighbor(coords))[0]
+        value_at_coordinates = extractor(item)
 
         # key is somewhat crummy
         combined_dict_key = ("{}:{}:{}:{}"
@@ -147,13 +93,10 @@ def extract(
             "time": [dt_str],
             "value": [value_at_coordinates]
         }
+        del item  # release message before reading the next one
 
     if not keep_target:
         os.remove(target)
         logging.debug("Target file '{}' deleted".format(target))
 
-    if q:
-        q.put((date_creation_str, result))
-        return None
-    else:
-        return date_creation_str, result
+    return date_creation_str, result
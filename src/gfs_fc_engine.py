@@ -4,10 +4,12 @@
 gfs_fc_engine.py
 
 invokes the client (subsequently in order of forecast time) and executes the
-extract module. Data in dictionary is stored into influxdb2 database.
+extract module, downloads being overlapped by extractions. Only steps not
+extracted by a previous run of the same cycle are fetched and merged into
+the result. Data in dictionary is stored into influxdb2 database.
 
 Parallel mode permits to run the client and extract module in parallel
-processing mode.
+processing mode, extraction by a bounded pool of worker processes.
 
 ref.: https://www.nco.ncep.noaa.gov/pmb/products/gfs/
 """
@@ -17,18 +19,30 @@ import logging
 import os
 import sys
 from argparse import ArgumentParser
-from datetime import datetime, timedelta
-from multiprocessing import Process, Queue
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
 
-from influxdb_client import InfluxDBClient
+import numpy as np
+from influxdb_client import InfluxDBClient, WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
 
 # internal
+from forecast_energy import (
+    expected_energy,
+    forecast_sites,
+    line_protocol,
+    log_intervals,
+    site_file,
+    write_csv
+)
 from fronius_aux import get_secret
-from gfs_fc_aux import (defined_kwargs, CONFIG, STEPS, DATA_FILE, DATA_DIR,
-                        MYFORMAT)
+from gfs_fc_aux import (defined_kwargs, init_worker, pool_size, CONFIG, STEPS,
+                        DATA_FILE, DATA_DIR, MYFORMAT)
 from gfs_fc_client import Client
 from gfs_fc_download import extract
+from gfs_fc_manifest import Manifest, merge, parameter_keys, save_json
+from gfs_fc_pipeline import run_pipeline
 from sun_influx import SunInflux
 
 
@@ -67,20 +81,6 @@ def main(
     )
     influx_write_api = influx_client.write_api(write_options=SYNCHRONOUS)
 
-    ps = list()  # list of processes
-    qs = list()  # list of queues
-
-    dict_x = dict()
-    def collect(r: dict) -> dict:
-        for k, v in r.items():
-            try:
-                dict_x[k]['time'].extend(v['time'])
-                dict_x[k]['value'].extend(v['value'])
-            except KeyError:
-                dict_x[k] = v
-        return dict_x
-    # end module collect
-
     client = Client(
         # grid: mandatory [SLS|GLOB]
         grid= "SLS",
@@ -93,116 +93,109 @@ def main(
             parameter=CONFIG.get('gfs_forecast'),
             # if missing, most recent date and/or time with data available
             date=CONFIG.get('date'),
-            time=CONFIG.get('time')
+            time=CONFIG.get('time'),
+            # if missing, defaults of gfs_fc_session and gfs_fc_cache
+            rate_limit=CONFIG.get('nomads', {}).get('rate_limit'),
+            cache=CONFIG.get('nomads', {}).get('cache')
         )
     )
 
-    for step in CONFIG.get("steps", STEPS):
-        results = client.retrieve(
-            step=step,
-            **defined_kwargs(
-                target=CONFIG.get('target')
-            )
-        )
-        # success, match file size(s)
-        logging.debug(f"File '{results.target}' size matched: {results.rc}")
-        if not results.target:
-            continue
-
-        if parallel:
-            queue = Queue()
-            p = Process(target=extract,
-                        args=(results.target, queue, keep_target),
-                        daemon=True)
-            # no join() required
-            p.start()
-            # renice on raspberry Pi
-            os.system("renice -n 19 -p {} >/dev/null".format(p.pid))
-            ps.append(p)
-            qs.append(queue)
-            logging.debug("Number of alive processes: {}"
-                  .format(sum([i.is_alive() for i in ps])))
-        else:
-            date_creation_string, res = extract(target=results.target)
-            dict_x = collect(res)
-
-    for q in qs:  # collecting from queue
-        date_creation_string, res = q.get()
-        dict_x = collect(res)
-
-    with open(DATA_FILE, "w") as jsonFile:
-        if os.getuid() == 0:  # chmod only if root
-            os.chmod(DATA_FILE, 0o666)  # docker owner is root, anyone can delete
-        json.dump(dict_x,
-                  jsonFile,
-                  indent=2,
-                  sort_keys=True)
-
-    z = SunInflux(
-        parameter=CONFIG,
-        debug=CONFIG['debug']
+    # steps of the cycle extracted by previous runs are kept
+    manifest = Manifest(
+        cycle=client.cycle,
+        parameters=parameter_keys(CONFIG.get('gfs_forecast')),
+        sites=[[site['location']['latitude'], site['location']['longitude']]
+               for _, site in forecast_sites(CONFIG)]
     )
+    dict_x = dict()
+    if manifest:
+        try:
+            with open(DATA_FILE, "r") as jsonFile:
+                dict_x = json.load(jsonFile)
+        except (Exception,) as e:
+            logging.warning("Result of previous run lost: {}".format(e))
+            manifest.clear()
+    steps = manifest.missing(CONFIG.get("steps", STEPS))
+    logging.info("Cycle {}: {} step(s) to be fetched".format(client.cycle,
+                                                             len(steps)))
+
+    # bounded pool of extraction workers, set up once per worker
+    executor: ProcessPoolExecutor | None = None
+    max_workers = 1
+    if parallel:
+        max_workers = pool_size(CONFIG.get('max_workers'))
+        logging.debug("Number of extraction workers: {}".format(max_workers))
+        executor = ProcessPoolExecutor(max_workers=max_workers,
+                                       initializer=init_worker)
+
+    # downloads overlapped by extractions
+    try:
+        for step, (date_creation_string, res) in run_pipeline(
+                client=client,
+                steps=steps,
+                extract=partial(extract, keep_target=keep_target),
+                target=CONFIG.get('target'),
+                executor=executor,
+                max_workers=max_workers,
+                queue_size=CONFIG.get('queue_size', 2),
+                keep_target=keep_target):
+            # result before manifest, an interrupted run resumes from there
+            save_json(DATA_FILE, merge(dict_x, res))
+            manifest.complete(step)
+    finally:
+        if executor:
+            executor.shutdown()
+        logging.info(client.session)
+        logging.info(client.cache)
 
     data = dict_x["Surface downward short-wave radiation flux:surface:instant:0"]
     datum = [datetime.strptime(i, '%Y%m%d%H%M') for i in data['time']]
-    values = [i for i in data['value']]
-    records = list()
-
-    csv_file_io = open("{}/solar_exp_power_gfs.csv".format(DATA_DIR), "w")
-    csv_file_io.write(
-        "{}, {}\n".format("date (UTC)", "expected solar energy (kWh)")
-    )
+    values = np.array(data['value'], dtype=float).reshape(len(datum), -1)
 
-    for i in range(len(datum) - 1):
-        t = z.calc_modified(
-            from_date=datum[i],
-            to_date=datum[i + 1]
+    for (tags, site), column in zip(forecast_sites(CONFIG), values.T):
+        z = SunInflux(
+            parameter=site,
+            debug=CONFIG['debug']
         )
-        r1 = t[0] * 3_600  # convert W to J
-        r2 = t[1] / 1_000  # convert to kWh
-        # avarage adjecent neighbors and convert from Watt to Joule times
+        # solar geometry integrated over the entire horizon in one pass
+        horizon = z.calc_horizon(dates=datum)
+        maximum = horizon[0] * 3_600  # convert W to J
+        panels = horizon[1] / 1_000  # convert to kWh
+        # average adjacent neighbors and convert from Watt to Joule times
         # period of time in unit of hours
-        forecasted_flux = ((values[i] + values[i + 1]) * 1800 *
-                           (datum[i + 1] - datum[i]) / timedelta(hours=1))
-
-        logging.debug(
-            "Date: {}, "
-            "Forecasted Flux [J m**-2]: {:.2E}, "
-            "Max Flux [J m**-2]: {:.2E}, "
-            "ratio: {:.3}, "
-            "Energy on PV panels [kW]: {:.3}, "
-            "Energy on PV panels corr. [kW]: {:.3}".format(
-                datum[i],
-                forecasted_flux,
-                r1,
-                r1 and forecasted_flux / r1 or 0.,
-                r2,
-                r2 * (r1 and forecasted_flux / r1 or 0.))
-        )
-
-        csv_file_io.write(
-            "{}, {}\n".format(datum[i],
-                              r2 * (r1 and forecasted_flux / r1 or 0.))
-        )
-
-        records.append(
-            {
-                "measurement": "Forecast",
-                "time": datum[i],
-                "fields": {"dswrf": r2 * (r1 and forecasted_flux / r1 or 0.)}
-            }
-        )
-    # end for loop over date/time entries
-
-    if not test:
-        influx_write_api.write(
-            bucket="Fronius",
-            org="Fronius",
-            record=records
-        )
+        hours = np.diff(
+            np.array(datum, dtype='datetime64[s]')) / np.timedelta64(1, 'h')
+        forecasted_flux = (column[:-1] + column[1:]) * 1800 * hours
+        energy, ratio = expected_energy(flux=forecasted_flux,
+                                        maximum=maximum,
+                                        panels=panels)
+
+        if tags:
+            logging.debug("Location: {}".format(tags['location']))
+        log_intervals(datum[:-1], {
+            "Forecasted Flux [J m**-2]": forecasted_flux,
+            "Max Flux [J m**-2]": maximum,
+            "ratio": ratio,
+            "Energy on PV panels [kW]": panels,
+            "Energy on PV panels corr. [kW]": energy})
+        write_csv(site_file("{}/solar_exp_power_gfs.csv".format(DATA_DIR),
+                            tags),
+                  ("date (UTC)", "expected solar energy (kWh)"),
+                  datum[:-1],
+                  energy)
+
+        if not test:
+            influx_write_api.write(
+                bucket="Fronius",
+                org="Fronius",
+                record=line_protocol(measurement="Forecast",
+                                     times=datum[:-1],
+                                     fields={"dswrf": energy},
+                                     tags=tags),
+                write_precision=WritePrecision.S
+            )
 
     influx_write_api.close()
-    csv_file_io.close()
 
     logging.info(f"{os.path.basename(__file__)} exited.")
     sys.exit(0)
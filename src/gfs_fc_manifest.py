@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+gfs_fc_manifest.py
+
+manifest of the (cycle, step, parameter) tuples extracted to forecast_gfs.json
+so far. A run of the same cycle fetches only the steps missing and merges them
+into the existing result, a newer cycle starts over. The result is written
+before the manifest on completion of each step, such that interrupted runs
+resume where they stopped.
+"""
+import json
+import logging
+import os
+
+# internal
+from gfs_fc_aux import DATA_DIR
+
+MANIFEST_FILE = "{}/forecast_gfs_manifest.json".format(DATA_DIR)
+
+
+def parameter_keys(parameter: list[dict] | None) -> list[str]:
+    """
+    :param parameter: gfs_forecast of parameter.json, None for entire set
+    :return: one key per parameter selection
+    """
+
+    if not parameter:
+        return ["*"]
+
+    return ["{}:{}:{}".format(",".join(p['shortName']),
+                              p.get('typeOfLevel', ""),
+                              p.get('validity', ""))
+            for p in parameter]
+
+
+def save_json(
+        file: str,
+        data: dict
+) -> None:
+    """
+    write atomically, readable and deletable by anyone
+    :param file:
+    :param data:
+    :return:
+    """
+
+    tmp = "{}.{}.tmp".format(file, os.getpid())
+    with open(tmp, "w") as jsonFile:
+        json.dump(data,
+                  jsonFile,
+                  indent=2,
+                  sort_keys=True)
+    if os.getuid() == 0:  # chmod only if root
+        os.chmod(tmp, 0o666)  # docker owner is root, anyone can delete
+    os.replace(tmp, file)
+
+
+def merge(
+        result: dict,
+        update: dict
+) -> dict:
+    """
+    merge extracted steps into result, ordered by time, values of update
+    replace those of the same time
+    :param result: key -> {"unit", "time", "value"}
+    :param update: same format
+    :return: result
+    """
+
+    for k, v in update.items():
+        if k not in result:
+            result[k] = v
+            continue
+        series = dict(zip(result[k]['time'], result[k]['value']))
+        series.update(zip(v['time'], v['value']))
+        result[k]['time'] = sorted(series)  # YYYYMMDDHHMM
+        result[k]['value'] = [series[t] for t in result[k]['time']]
+
+    return result
+
+
+class Manifest(object):
+    def __init__(
+            self,
+            *,
+            cycle: str,
+            parameters: list[str],
+            sites: list[list[float]],
+            file: str = MANIFEST_FILE
+    ) -> None:
+        """
+        :param cycle: base time of the run YYYYMMDDHH
+        :param parameters: keys of parameters extracted per step
+        :param sites: latitude, longitude per site extracted
+        :param file: of the manifest, next to forecast_gfs.json
+        """
+
+        self.cycle = cycle
+        self.parameters = parameters
+        self.sites = sites
+        self.file = file
+        try:
+            with open(file, "r") as f:
+                manifest = json.load(f)
+            completed = {tuple(i) for i in manifest['completed']}
+            if manifest.get('sites') != sites:
+                logging.info("Manifest {} discarded: sites changed"
+                             .format(file))
+                completed = set()
+        except FileNotFoundError:
+            completed = set()
+        except (Exception,) as e:
+            logging.warning("Manifest {} discarded: {}".format(file, e))
+            completed = set()
+        # steps of another (older) cycle are obsolete
+        self.__completed: set[tuple[str, int, str]] = \
+            {i for i in completed if i[0] == cycle}
+        if completed and not self.__completed:
+            logging.info("Manifest of cycle {} superseded by {}".format(
+                min(i[0] for i in completed), cycle))
+
+    def __bool__(self) -> bool:
+        return bool(self.__completed)
+
+    def clear(self) -> None:
+        """
+        start over, e.g. if the result is lost
+        :return:
+        """
+
+        self.__completed.clear()
+
+    def missing(
+            self,
+            steps: list[int]
+    ) -> list[int]:
+        """
+        :param steps: forecast hours requested
+        :return: those lacking any parameter, in order
+        """
+
+        return [step for step in steps
+                if any((self.cycle, step, p) not in self.__completed
+                       for p in self.parameters)]
+
+    def complete(
+            self,
+            step: int
+    ) -> None:
+        """
+        record step as extracted with all parameters and save
+        :param step:
+        :return:
+        """
+
+        self.__completed.update((self.cycle, step, p)
+                                for p in self.parameters)
+        save_json(self.file, {"sites": self.sites,
+                              "completed": sorted(self.__completed)})
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+"""
+gfs_fc_pipeline.py
+
+overlapped download and extraction of GFS steps: a single downloader thread
+retrieves the steps in order (rate limited by the client) and feeds a bounded
+queue of files, which are extracted in place or by a pool of worker processes
+meanwhile. Wall time approaches the longer of both stages instead of their
+sum, the no of files downloaded but not yet extracted stays bounded. Results
+are passed on as they finish. If extraction fails or the caller stops
+iterating, the downloader is stopped and files not extracted are removed.
+"""
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Callable, Iterator
+
+# internal
+from gfs_fc_aux import defined_kwargs
+from gfs_fc_client import Client
+
+_DONE = None  # sentinel, no more files
+_POLL: float = 1.  # seconds between checks for stop while queue is full
+
+
+def _discard(
+        file: str,
+        keep_target: bool
+) -> None:
+    """
+    remove a file downloaded, but not extracted
+    :param file:
+    :param keep_target: keep file, if True
+    :return:
+    """
+
+    if not keep_target:
+        try:
+            os.remove(file)
+            logging.debug("Target file '{}' deleted".format(file))
+        except FileNotFoundError:
+            pass
+
+
+def _put(
+        q: Queue,
+        item: tuple[int, str] | None,
+        stop: Event
+) -> bool:
+    """
+    :param q:
+    :param item:
+    :param stop: gives up, if set while queue is full
+    :return: True, if put
+    """
+
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL)
+            return True
+        except Full:
+            continue
+
+    return False
+
+
+def _download(
+        client: Client,
+        steps: list[int],
+        target: str | None,
+        q: Queue,
+        errors: list[Exception],
+        stop: Event,
+        keep_target: bool
+) -> None:
+    """
+    producer: download steps in order
+    :param client:
+    :param steps:
+    :param target: name of target files, default of client if None
+    :param q: receives step and file, blocks while full
+    :param errors: receives an exception aborting the downloads
+    :param stop: no further downloads, if set
+    :param keep_target: keep a file not queued on stop, if True
+    :return:
+    """
+
+    try:
+        for step in steps:
+            if stop.is_set():
+                break
+            results = client.retrieve(
+                step=step,
+                **defined_kwargs(
+                    target=target
+                )
+            )
+            # success, match file size(s)
+            logging.debug(
+                f"File '{results.target}' size matched: {results.rc}")
+            if results.target and not _put(q, (step, results.target), stop):
+                _discard(results.target, keep_target)
+    except (Exception,) as e:
+        errors.append(e)
+    finally:
+        _put(q, _DONE, stop)
+
+
+def run_pipeline(
+        *,
+        client: Client,
+        steps: list[int],
+        extract: Callable[[str], tuple[str, dict]],
+        target: str | None = None,
+        executor: Executor | None = None,
+        max_workers: int = 1,
+        queue_size: int = 2,
+        keep_target: bool = False
+) -> Iterator[tuple[int, tuple[str, dict]]]:
+    """
+    download and extract all steps
+    :param client:
+    :param steps: forecast hours
+    :param extract: file -> date of creation, result; picklable if executor
+    :param target: name of target files, default of client if None
+    :param executor: pool of extraction workers, extraction in the calling
+    thread if None
+    :param max_workers: no of workers of executor, max. no of extractions
+    in progress
+    :param queue_size: max. no of files downloaded, but not yet extracted
+    :param keep_target: keep files not extracted on failure or abort, if
+    True
+    :return: step and result of extract, as extractions finish
+    """
+
+    q: Queue = Queue(maxsize=queue_size)
+    errors: list[Exception] = list()
+    stop = Event()
+    downloader = Thread(target=_download,
+                        args=(client, steps, target, q, errors, stop,
+                              keep_target),
+                        name="gfs_download",
+                        daemon=True)
+    downloader.start()
+
+    pending: dict[Future, tuple[int, str]] = dict()
+
+    def harvest(
+            done: set[Future]
+    ) -> Iterator[tuple[int, tuple[str, dict]]]:
+        for future in done:
+            step, file = pending.pop(future)
+            if future.exception() is not None:
+                _discard(file, keep_target)  # extraction failed
+            yield step, future.result()
+
+    try:
+        while True:
+            if len(pending) >= max_workers:
+                # all workers busy, wait for one before taking the next file
+                yield from harvest(
+                    wait(pending, return_when=FIRST_COMPLETED).done)
+            if (item := q.get()) is _DONE:
+                break
+            step, file = item
+            if executor is None:
+                try:
+                    result = extract(file)
+                except (Exception,):
+                    _discard(file, keep_target)  # extraction failed
+                    raise
+                yield step, result
+                continue
+            pending[executor.submit(extract, file)] = item
+            logging.debug("Extractions in progress: {}, files queued: {}"
+                          .format(len(pending), q.qsize()))
+        yield from harvest(wait(pending).done)
+    finally:
+        # on abort: stop downloading, the downloader gives up a full queue
+        stop.set()
+        downloader.join()
+        while True:
+            try:
+                item = q.get_nowait()
+            except Empty:
+                break
+            if item is not _DONE:
+                _discard(item[1], keep_target)
+        # extractions not started yet, those running remove their files
+        for future, (_, file) in pending.items():
+            if future.cancel():
+                _discard(file, keep_target)
+    if errors:
+        raise errors[0]
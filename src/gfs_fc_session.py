@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+gfs_fc_session.py
+
+rate-limited HTTP session for NOMADS. NOMADS permits a rate limit of
+<120/minute to their site. Hits are considered to be head/listing commands
+as well as actual data download attempts, i.e. every http request. The block
+is temporary and typically lasts for 10 minutes, the system is automatically
+configured to blacklist an IP if it continually hits the site over the
+threshold (source: ncep.pmb.dataflow@noaa.gov).
+
+Every request sent by the session, including redirects, takes a token from a
+bucket refilled at "requests_per_minute" and holding up to "burst" tokens.
+Any 60 seconds thus comprise at most requests_per_minute + burst requests.
+"""
+import logging
+from threading import Lock
+from time import monotonic, sleep
+
+import requests
+
+REQUESTS_PER_MINUTE: float = 100.
+BURST: int = 10
+NOMADS_LIMIT: int = 120  # requests per minute, exclusive
+
+
+class TokenBucket(object):
+    def __init__(
+            self,
+            *,
+            rate: float,
+            burst: int
+    ) -> None:
+        """
+        :param rate: tokens per second
+        :param burst: capacity, bucket is full initially
+        """
+
+        assert rate > 0 and burst >= 1, "Rate and burst must be positive!"
+        self.rate = rate
+        self.burst = burst
+        self.__tokens: float = float(burst)
+        self.__last: float = monotonic()
+        self.__lock = Lock()
+        # metrics
+        self.acquired: int = 0
+        self.waited: float = 0.
+
+    def acquire(self) -> float:
+        """
+        take a token, wait until one is available
+        :return: seconds waited
+        """
+
+        with self.__lock:  # waiting requests are served in turn
+            now = monotonic()
+            self.__tokens = min(self.burst,
+                                self.__tokens + (now - self.__last) * self.rate)
+            self.__last = now
+            wait = max(0., (1. - self.__tokens) / self.rate)
+            if wait:
+                sleep(wait)
+                self.__tokens, self.__last = 1., monotonic()
+            self.__tokens -= 1.
+            self.acquired += 1
+            self.waited += wait
+
+        return wait
+
+
+class RateLimitedSession(requests.Session):
+    def __init__(
+            self,
+            *,
+            requests_per_minute: float = REQUESTS_PER_MINUTE,
+            burst: int = BURST
+    ) -> None:
+        """
+        :param requests_per_minute: sustained rate
+        :param burst: max. no of requests sent at once
+        """
+
+        super().__init__()
+        if requests_per_minute + burst >= NOMADS_LIMIT:
+            logging.warning(
+                "Rate limit {}/min plus burst {} may exceed the NOMADS limit "
+                "of {}/min!".format(requests_per_minute, burst, NOMADS_LIMIT))
+        self.bucket = TokenBucket(rate=requests_per_minute / 60., burst=burst)
+
+    def send(
+            self,
+            request: requests.PreparedRequest,
+            **kwargs
+    ) -> requests.Response:
+        wait = self.bucket.acquire()
+        if wait:
+            logging.debug("Rate limit: waited {:.2f}s for {} {}"
+                          .format(wait, request.method, request.url))
+
+        return super().send(request, **kwargs)
+
+    def __str__(self) -> str:
+        return "NOMADS requests: {}, waited {:.1f}s in total".format(
+            self.bucket.acquired, self.bucket.waited)
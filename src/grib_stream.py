@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+"""
+grib_stream.py
+
+streaming decode of GRIB files, shared by ECMWF and GFS: messages are read
+lazily one at a time and released after use, such that memory stays flat
+regardless of the no of steps and parameters of a file. Values are
+interpolated bilinearly from the cells enclosing the sites, whose indices and
+weights are determined once per grid definition and sites (InterpolationPlan)
+by bisection of the 1-D coordinate axes taken from GRIB metadata, instead of
+computing latitudes, longitudes, masks and an interpolator for each message.
+"""
+from typing import Iterator
+
+import numpy as np
+import numpy.typing as npt
+import pygrib
+
+# keys defining the geometry of a regular lat/lon grid
+_GRID_KEYS = ("gridType",
+              "Ni",
+              "Nj",
+              "latitudeOfFirstGridPointInDegrees",
+              "longitudeOfFirstGridPointInDegrees",
+              "latitudeOfLastGridPointInDegrees",
+              "longitudeOfLastGridPointInDegrees")
+
+
+def messages(target: str) -> Iterator[pygrib.gribmessage]:
+    """
+    messages of a GRIB file, read one at a time
+    :param target: GRIB file
+    :return: iterator, the file is closed once exhausted or closed
+    """
+
+    grbs = pygrib.open(target)
+    try:
+        for message in grbs:
+            yield message
+    finally:
+        grbs.close()
+
+
+def grid_key(message: pygrib.gribmessage) -> tuple:
+    return tuple(message[key] for key in _GRID_KEYS)
+
+
+def grid_axes(
+        message: pygrib.gribmessage
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    1-D latitude and longitude axes of a grid in the order of the values,
+    from GRIB metadata without building the full meshes of latlons(), as
+    pygrib does for regular grids
+    :param message:
+    :return: latitudes, longitudes
+    """
+
+    if message['gridType'] not in ('regular_ll', 'regular_gg'):
+        lats, lons = message.latlons()
+        return lats[:, 0], lons[0, :]
+    lats = np.asarray(message['distinctLatitudes'], dtype=float)
+    if (message['Nj'] > 1
+            and message['latitudeOfLastGridPointInDegrees']
+            < message['latitudeOfFirstGridPointInDegrees']
+            and lats[-1] > lats[0]):
+        lats = lats[::-1]
+
+    return lats, np.asarray(message['distinctLongitudes'], dtype=float)
+
+
+def locate(
+        axis: np.ndarray,
+        x: float,
+        periodic: bool = False
+) -> tuple[int, int, float]:
+    """
+    segment of a monotonic axis comprising x, by bisection
+    :param axis: ascending or descending, at least 2 points
+    :param x: coordinate
+    :param periodic: axis of longitudes spanning the globe, the last point
+    is then followed by the first
+    :return: indices of both ends of the segment, fraction of x within
+    """
+
+    if len(axis) < 2:
+        raise ValueError("Site not enclosed by grid: {}".format(axis))
+    sign = 1. if axis[-1] > axis[0] else -1.
+    ascending, x = sign * axis, sign * x
+    if periodic:
+        # longitude within [first, first + 360[
+        x = ascending[0] + (x - ascending[0]) % 360.
+        ascending = np.append(ascending, ascending[0] + 360.)
+    if not ascending[0] <= x <= ascending[-1]:
+        raise ValueError("Site {} outside of {}".format(sign * x, axis))
+    i = min(int(np.searchsorted(ascending, x, side='right')) - 1,
+            len(ascending) - 2)
+
+    return (i,
+            (i + 1) % len(axis),
+            float((x - ascending[i]) / (ascending[i + 1] - ascending[i])))
+
+
+class InterpolationPlan(object):
+    def __init__(
+            self,
+            *,
+            lats: np.ndarray,
+            lons: np.ndarray,
+            coordinates: np.ndarray
+    ) -> None:
+        """
+        bilinear interpolation at sites, indices and weights of the four
+        corners of the enclosing cells computed once
+        :param lats: latitude axis of the grid
+        :param lons: longitude axis of the grid
+        :param coordinates: latitude, longitude per site, shape (k, 2),
+        longitudes in any convention
+        """
+
+        step = abs(lons[1] - lons[0]) if len(lons) > 1 else 360.
+        periodic = abs(len(lons) * step - 360.) < step / 2.
+        rows, cols, weights = list(), list(), list()
+        for latitude, longitude in coordinates:
+            i0, i1, u = locate(lats, latitude)
+            j0, j1, v = locate(lons, longitude, periodic=periodic)
+            rows.append([i0, i0, i1, i1])
+            cols.append([j0, j1, j0, j1])
+            weights.append([(1. - u) * (1. - v),
+                            (1. - u) * v,
+                            u * (1. - v),
+                            u * v])
+        self.rows = np.array(rows)
+        self.cols = np.array(cols)
+        self.weights = np.array(weights)
+
+    def __call__(
+            self,
+            values: np.ndarray
+    ) -> np.ndarray:
+        """
+        :param values: entire field of a message, shape (Nj, Ni)
+        :return: value per site, shape (k,)
+        """
+
+        return (values[self.rows, self.cols] * self.weights).sum(axis=1)
+
+
+# grid key -> axes, (grid key, sites) -> plan, shared within a process. Not
+# persisted, a plan is built in microseconds per site
+_AXES: dict[tuple, tuple[np.ndarray, np.ndarray]] = dict()
+_PLANS: dict[tuple, InterpolationPlan] = dict()
+
+
+class PointExtractor(object):
+    def __init__(
+            self,
+            *,
+            coordinates: npt.ArrayLike
+    ) -> None:
+        """
+        :param coordinates: latitude, longitude per site, shape (k, 2), or
+        of one site, shape (2,)
+        """
+
+        self.single = np.ndim(coordinates) == 1
+        self.coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        self.__sites = tuple(map(tuple, self.coordinates.tolist()))
+
+    def _plan(
+            self,
+            message: pygrib.gribmessage
+    ) -> InterpolationPlan:
+        key = grid_key(message)
+        plan = _PLANS.get((key, self.__sites))
+        if plan is None:
+            axes = _AXES.get(key)
+            if axes is None:
+                axes = _AXES[key] = grid_axes(message)
+            plan = InterpolationPlan(lats=axes[0],
+                                     lons=axes[1],
+                                     coordinates=self.coordinates)
+            _PLANS[(key, self.__sites)] = plan
+
+        return plan
+
+    def __call__(
+            self,
+            message: pygrib.gribmessage
+    ) -> float | list[float]:
+        """
+        values of message interpolated at all sites in one step
+        :param message:
+        :return: value per site, value if of one site
+        """
+
+        values = self._plan(message)(message.values).tolist()
+
+        return values[0] if self.single else values
@@ -5,15 +5,22 @@ import logging
 import os
 import sys
 from argparse import ArgumentParser
-from datetime import datetime, timedelta
+from datetime import datetime
 
+import numpy as np
 import urllib3.exceptions
-from influxdb_client import InfluxDBClient
+from influxdb_client import InfluxDBClient, WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
 from requests import get, HTTPError, Response, exceptions
 from urllib3.exceptions import ReadTimeoutError
 
 # internal
+from forecast_energy import (
+    expected_energy,
+    line_protocol,
+    log_intervals,
+    write_csv
+)
 from fronius_aux import get_secret
 from sun_influx import SunInflux
 
@@ -115,73 +122,49 @@ def main(
         debug=CONFIG['debug']
     )
 
-    diffuse = dict_x['diffuse_radiation']
-    direct = dict_x['direct_radiation']
     datum = [datetime.strptime(i, '%Y-%m-%dT%H:%M') for i in dict_x['time']]
-    records = list()
-
-    csv_file_io = open("{}/solar_exp_power.csv".format(DATA_DIR), "w")
-    csv_file_io.write(
-        "{}, {}, {}\n".format(
-            "date (UTC)",
-            "expected direct solar energy (kWh)",
-            "expected diffuse solar energy (kWh)")
-    )
-
-    for i in range(len(datum) - 1):
-        r1, r2, r3 = z.calc_modified(
-            from_date=datum[i],
-            to_date=datum[i + 1]
-        )
-        forecasted_flux = (max(direct[i + 1], 0.)  # average of last hour
-                           * (datum[i + 1] - datum[i]) / timedelta(hours=1))
-        forecasted_diffuse = (max(diffuse[i + 1], 0.)
-                              * (datum[i + 1] - datum[i]) / timedelta(hours=1))
-
-        logging.debug(
-            "Date: {}, "
-            "Forecasted Flux [W m**-2]: {:.2E}, "
-            "Max Flux [W m**-2]: {:.2E}, "
-            "ratio: {:.3}, "
-            "Energy on PV panels [kW]: {:.3}, "
-            "Energy on PV panels corr. [kW]: {:.3}, "
-            "Diffuse Energy on PV panels [kW]: {:.3}"
-            .format(
-                datum[i + 1],
-                forecasted_flux,
-                r1,
-                r1 and forecasted_flux / r1 or 0.,
-                r2 / 1_000,
-                r2 * (r1 and forecasted_flux / r1 or 0.) / 1_000,
-                r3 * forecasted_diffuse / 1_000)
-        )
-        csv_file_io.write(
-            "{}, {}, {}\n".format(
-                datum[i + 1],
-                r2 * (r1 and forecasted_flux / r1 or 0.) / 1_000,
-                r3 * forecasted_diffuse / 1_000)
-        )
-        records.append(
-            {
-                "measurement": "Forecast",
-                "time": datum[i + 1],
-                "fields": {
-                    "forecast":
-                        (r2 * (r1 and forecasted_flux / r1 or 0.) +
-                         r3 * forecasted_diffuse) / 1_000}
-            }
-        )
-    # end for loop over date/time entries
+    # averages of last hour, converted to Wh m⁻² per interval
+    hours = np.diff(np.array(datum, dtype='datetime64[s]')) / np.timedelta64(
+        1, 'h')
+    forecasted_flux = np.maximum(
+        np.array(dict_x['direct_radiation'][1:], dtype=float), 0.) * hours
+    forecasted_diffuse = np.maximum(
+        np.array(dict_x['diffuse_radiation'][1:], dtype=float), 0.) * hours
+
+    # solar geometry integrated over the entire horizon in one pass
+    maximum, panels, diffuse = z.calc_horizon(dates=datum)
+    energy_direct, ratio = expected_energy(flux=forecasted_flux,
+                                           maximum=maximum,
+                                           panels=panels / 1_000)  # kWh
+    energy_diffuse = diffuse * forecasted_diffuse / 1_000  # kWh
+
+    log_intervals(datum[1:], {
+        "Forecasted Flux [W m**-2]": forecasted_flux,
+        "Max Flux [W m**-2]": maximum,
+        "ratio": ratio,
+        "Energy on PV panels [kW]": panels / 1_000,
+        "Energy on PV panels corr. [kW]": energy_direct,
+        "Diffuse Energy on PV panels [kW]": energy_diffuse})
+    write_csv("{}/solar_exp_power.csv".format(DATA_DIR),
+              ("date (UTC)",
+               "expected direct solar energy (kWh)",
+               "expected diffuse solar energy (kWh)"),
+              datum[1:],
+              energy_direct,
+              energy_diffuse)
 
     if not test:
         influx_write_api.write(
             bucket="Fronius",
             org="Fronius",
-            record=records
+            record=line_protocol(measurement="Forecast",
+                                 times=datum[1:],
+                                 fields={"forecast":
+                                         energy_direct + energy_diffuse}),
+            write_precision=WritePrecision.S
         )
 
     influx_write_api.close()
-    csv_file_io.close()
 
     logging.info(f"{os.path.basename(__file__)} exited.")
     sys.exit(0)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""
+sun_ephemeris.py
+
+cache of sun elevation and azimuth for one location: a year is precomputed
+on a grid of "step" seconds (sun_vector.solar_position), stored as .npy
+file and memory-mapped thereafter. Lookups are linearly interpolated, the
+azimuth across North properly. The geometric elevation is interpolated and
+corrected for refraction thereafter, as the latter is not smooth near the
+horizon. Files are keyed by location, year and step,
+so they are reused by any subsequent run and rebuilt on change of location.
+"""
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+
+# internal
+from sun_vector import refraction, solar_position, to_datetime64
+
+DTYPE = np.float32  # 1e-5 degree suffices
+
+
+class SunEphemeris(object):
+    def __init__(
+            self,
+            *,
+            latitude: float,
+            longitude: float,
+            directory: str,
+            step: int = 60
+    ) -> None:
+        """
+        :param latitude: degrees
+        :param longitude: degrees
+        :param directory: of the cache files, created if missing
+        :param step: grid spacing in seconds, must divide a day
+        """
+
+        assert 86_400 % step == 0, "Step must divide a day!"
+        self.latitude = latitude
+        self.longitude = longitude
+        self.directory = directory
+        self.step = step
+        self.__years: dict[int, np.ndarray] = dict()
+
+    def _file(
+            self,
+            year: int
+    ) -> str:
+        return "{}/ephemeris_{:.4f}_{:.4f}_{}_{}s.npy".format(
+            self.directory, self.latitude, self.longitude, year, self.step)
+
+    def _year(
+            self,
+            year: int
+    ) -> np.ndarray:
+        """
+        geometric elevation and azimuth of one year plus its upper boundary, memory
+        mapped from file, computed and stored if missing or corrupt
+        :param year:
+        :return: shape (n + 1, 2)
+        """
+
+        table = self.__years.get(year)
+        if table is not None:
+            return table
+
+        file = self._file(year)
+        start = np.datetime64("{:04d}-01-01".format(year), 's')
+        end = np.datetime64("{:04d}-01-01".format(year + 1), 's')
+        n = int((end - start) / np.timedelta64(self.step, 's'))
+        try:
+            table = np.load(file, mmap_mode='r')
+            if table.shape != (n + 1, 2):
+                raise ValueError("Unexpected shape {}".format(table.shape))
+        except (Exception,) as e:
+            if os.path.exists(file):
+                logging.warning("Ephemeris {} discarded: {}".format(file, e))
+            logging.info("Computing ephemeris {} ...".format(file))
+            times = start + np.arange(n + 1) * np.timedelta64(self.step, 's')
+            el, az = solar_position(times,
+                                    latitude=self.latitude,
+                                    longitude=self.longitude,
+                                    with_refraction=False)
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = "{}.{}.tmp".format(file, os.getpid())
+            with open(tmp, "wb") as f:
+                np.save(f, np.stack((el, az), axis=1).astype(DTYPE))
+            os.replace(tmp, file)  # atomic for concurrent forecast runs
+            table = np.load(file, mmap_mode='r')
+        self.__years[year] = table
+
+        return table
+
+    def __call__(
+            self,
+            times: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        interpolated sun position
+        :param times: datetime64, naive UTC, resolution up to ms
+        :return: elevation, azimuth in degrees
+        """
+
+        times = times.astype("datetime64[ms]")
+        years = times.astype("datetime64[Y]").astype(int) + 1970
+        el = np.empty(times.shape, dtype=float)
+        az = np.empty(times.shape, dtype=float)
+        for year in np.unique(years):
+            mask = years == year
+            table = self._year(int(year))
+            offset = ((times[mask]
+                       - np.datetime64("{:04d}-01-01".format(year), 'ms'))
+                      .astype(np.int64) / (self.step * 1_000.))
+            i = np.minimum(offset.astype(np.int64), len(table) - 2)
+            w = offset - i
+            lower = np.asarray(table[i], dtype=float)
+            upper = np.asarray(table[i + 1], dtype=float)
+            el[mask] = lower[:, 0] + (upper[:, 0] - lower[:, 0]) * w
+            # shortest way across North
+            d_az = (upper[:, 1] - lower[:, 1] + 180.) % 360. - 180.
+            az[mask] = (lower[:, 1] + d_az * w) % 360.
+
+        return el + refraction(el), az
+
+    def position(
+            self,
+            dateandtime: datetime
+    ) -> tuple[float, float]:
+        """
+        scalar lookup
+        :param dateandtime: naive UTC or aware
+        :return: elevation, azimuth in degrees
+        """
+
+        el, az = self(to_datetime64([dateandtime]))
+
+        return float(el[0]), float(az[0])
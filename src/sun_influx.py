@@ -1,16 +1,89 @@
-from datetime import datetime, timedelta
-from typing import Generator
+import os
+from datetime import datetime
+from typing import Callable
 
+import numpy as np
 from astral import LocationInfo
 from astral.sun import elevation, azimuth
 
 # internal imports
 from fronius_aux import (
     Math,
+    PanelArray,
     air_mass,
-    direct_radiation_on_tilted_surface,
     SOLAR_CONSTANT
 )
+from sun_ephemeris import SunEphemeris
+from sun_vector import (
+    air_mass as air_mass_vector,
+    solar_position,
+    to_datetime64
+)
+
+# ephemeris cache relative to source
+EPHEMERIS_DIR = "{}/data/ephemeris".format(
+    os.path.dirname(os.path.realpath(__file__)))
+# integration methods of calc_horizon
+TRAPEZOID = "trapezoid"
+GAUSS = "gauss"
+_MS = np.timedelta64(1, 'ms')
+
+
+def _adaptive_gauss_legendre(
+        f: Callable[[np.ndarray], np.ndarray],
+        a: np.ndarray,
+        b: np.ndarray,
+        *,
+        order: int = 3,
+        tolerance: float = 1e-3,
+        max_depth: int = 10
+) -> np.ndarray:
+    """
+    integrates f over all intervals [a, b] at once by Gauss-Legendre
+    quadrature. Intervals are bisected as long as the sum of both halves
+    deviates from the whole by more than tolerance (relative)
+    :param f: vectorized integrand, shape (n,) -> (k, n)
+    :param a: lower bounds, shape (m,)
+    :param b: upper bounds, shape (m,)
+    :param order: no of nodes per interval
+    :param tolerance: relative error per interval
+    :param max_depth: max. no of bisections
+    :return: shape (k, m)
+    """
+
+    x, w = np.polynomial.legendre.leggauss(order)
+
+    def rule(lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        half = (upper - lower) * 0.5
+        nodes = (lower + half)[:, np.newaxis] + half[:, np.newaxis] * x
+        values = f(nodes.ravel())
+        return values.reshape(len(values), *nodes.shape) @ w * half
+
+    index = np.arange(len(a))
+    whole = rule(a, b)
+    result = np.zeros_like(whole)
+    # error budget of each interval, shared by its parts in proportion to
+    # their lengths
+    budget = (tolerance * np.abs(whole) + 1e-9) / (b - a)
+    for depth in range(max_depth):
+        if not len(index):
+            break
+        mid = (a + b) * 0.5
+        # both halves of all intervals in one evaluation of f
+        halves = rule(np.concatenate((a, mid)), np.concatenate((mid, b)))
+        left, right = halves[:, :len(a)], halves[:, len(a):]
+        refined = left + right
+        done = np.all(
+            np.abs(refined - whole) <= budget[:, index] * (b - a),
+            axis=0) | (depth == max_depth - 1)
+        np.add.at(result.T, index[done], refined[:, done].T)
+        todo = ~done
+        a, b = np.concatenate((a[todo], mid[todo])), \
+            np.concatenate((mid[todo], b[todo]))
+        whole = np.concatenate((left[:, todo], right[:, todo]), axis=1)
+        index = np.concatenate((index[todo], index[todo]))
+
+    return result
 
 
 class SunInflux(object):
@@ -19,13 +92,16 @@ class SunInflux(object):
             self,
             *,
             parameter: dict,
-            debug: bool = False
+            debug: bool = False,
+            ephemeris: bool = True
     ):
         """
         Define location info
         All times in UTC
         :param parameter:
         :param debug:
+        :param ephemeris: sun position from precomputed ephemeris cache,
+        otherwise computed on each call
         """
 
         self.parameter = parameter
@@ -39,6 +115,19 @@ class SunInflux(object):
             timezone=parameter['location']['timezone']
         )
         self.debug = debug  # not used to date
+        self.ephemeris: SunEphemeris | None = SunEphemeris(
+            latitude=self.location.latitude,
+            longitude=self.location.longitude,
+            directory=EPHEMERIS_DIR
+        ) if ephemeris else None
+        self.panels = PanelArray(parameter['housetop'])
+        self.__area_eff = np.array(self.panels.area_eff)
+        self.__panel_terms = np.array((self.panels.sin_inclination,
+                                       self.panels.cos_inclination,
+                                       self.panels.sin_orientation,
+                                       self.panels.cos_orientation))
+        self.evaluations: int = 0  # of the solar geometry, for benchmarks
+        self.integration: dict = parameter.get('integration', {})
 
     def sun_parameter(
             self,
@@ -65,20 +154,18 @@ class SunInflux(object):
             }
         }
         # diffuse sunlight on all panels
-        for _, value in self.parameter['housetop'].items():
-            result[dateandtime]['panels']['diffuse'] += (
-                    value['area']['value']
-                    * value['efficiency']['value']
-                    * (1. + Math.cosdeg(value['inclination']['value'])) * 0.5)
-        # sun elevation
-        el = elevation(observer=self.location.observer,
-                       dateandtime=dateandtime,
-                       with_refraction=True)
-        if el > 0:
-            altitude = self.parameter["location"]["altitude"]["value"]
-            # sun azimuth
+        result[dateandtime]['panels']['diffuse'] = self.panels.diffuse
+        # sun elevation and azimuth
+        if self.ephemeris:
+            el, az = self.ephemeris.position(dateandtime)
+        else:
+            el = elevation(observer=self.location.observer,
+                           dateandtime=dateandtime,
+                           with_refraction=True)
             az = azimuth(observer=self.location.observer,
                          dateandtime=dateandtime)
+        if el > 0:
+            altitude = self.parameter["location"]["altitude"]["value"]
             air_mass_attenuation, _ = air_mass(
                 elevation=el,
                 altitude=altitude)
@@ -89,57 +176,240 @@ class SunInflux(object):
                                                    * Math.sindeg(el)
                                                    * air_mass_attenuation)
             # direct sunlight on all panels
-            for _, value in self.parameter['housetop'].items():
-                r = direct_radiation_on_tilted_surface(
-                    elevation=el,
-                    azimuth=az,
-                    inclination=value['inclination']['value'],
-                    orientation=value['orientation']['value'])
-                result[dateandtime]['panels']['direct'] += (
-                        SOLAR_CONSTANT
-                        * air_mass_attenuation
-                        * value['area']['value']
-                        * value['efficiency']['value']
-                        * r)
+            result[dateandtime]['panels']['direct'] = (
+                    SOLAR_CONSTANT
+                    * air_mass_attenuation
+                    * self.panels.direct(el, az))
 
         return result
 
-    @staticmethod
-    def _date_generator(
-            from_date: datetime,
-            to_date: datetime = None,
-            t_delta: int = 60
-    ) -> Generator[datetime, None, None]:
+    def _incidence(
+            self,
+            el: np.ndarray,
+            az: np.ndarray
+    ) -> np.ndarray:
         """
-        Datetime generator increases by 1 hr
-        :param from_date:
-        :param to_date: may be empty if integration over one hour from from_date
-        :param t_delta: time delta in minutes, must be equal time intervals
-        between from_date and to_date
-        :return: iterable
+        cosine of incidence on each panel group, not clipped
+        :param el: sun elevation angles in degrees, shape (n,)
+        :param az: sun azimuth angles in degrees, shape (n,)
+        :return: shape (n, no of panel groups)
+        """
+
+        sin_i, cos_i, sin_o, cos_o = self.__panel_terms
+        el_r = np.radians(el)[:, np.newaxis]
+        az_r = np.radians(az)[:, np.newaxis]
+
+        return (np.cos(el_r) * sin_i
+                * (cos_o * np.cos(az_r) + sin_o * np.sin(az_r))
+                + np.sin(el_r) * cos_i)
+
+    def _position(
+            self,
+            times: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        self.evaluations += len(times)
+        if self.ephemeris:
+            return self.ephemeris(times)
+        return solar_position(times,
+                              latitude=self.location.latitude,
+                              longitude=self.location.longitude)
+
+    def _signals(
+            self,
+            times: np.ndarray
+    ) -> np.ndarray:
+        """
+        sun elevation and cosine of incidence on each panel group, not
+        clipped, both continuous in time and negative with the sun below the
+        horizon or behind the panels
+        :param times: datetime64
+        :return: shape (1 + no of panel groups, n)
+        """
+
+        el, az = self._position(times)
+
+        return np.vstack((el, self._incidence(el, az).T))
+
+    def _breakpoints(
+            self,
+            start: np.datetime64,
+            end: np.datetime64,
+            scan: int = 120
+    ) -> tuple[np.ndarray, ...]:
         """
+        sunrises, sunsets and passages of the sun through the planes of the
+        panel groups in daylight, where the integrands are not smooth.
+        Signals are scanned every "scan" minutes, their sign changes are
+        refined by false position (Illinois) until steps below a second
+        :param start: datetime64
+        :param end: datetime64
+        :param scan: in minutes, shorter than any daylight or night
+        :return: begins and ends of daylight periods, passages, all
+        datetime64[ms]
+        """
+
+        start = start.astype('datetime64[ms]')
+        end = end.astype('datetime64[ms]')
+        grid = np.append(
+            np.arange(start, end, np.timedelta64(scan, 'm')), end)
+        signals = self._signals(grid)
+        positive = signals > 0.
+        row, i = np.nonzero(positive[:, 1:] != positive[:, :-1])
+        # passages with the sun below the horizon are irrelevant
+        relevant = (row == 0) | positive[0, i] | positive[0, i + 1]
+        row, i = row[relevant], i[relevant]
+        rising = (row == 0) & ~positive[0, i]
+        a, b = (grid[i] - start) / _MS, (grid[i + 1] - start) / _MS
+        f_a, f_b = signals[row, i], signals[row, i + 1]
+        step = np.abs(b - a)
+        for _ in range(50):
+            active = np.flatnonzero(step > 1_000.)
+            if not len(active):
+                break
+            c = b[active] - f_b[active] * (b[active] - a[active]) \
+                / (f_b[active] - f_a[active])
+            f_c = self._signals(
+                start + c.astype(np.int64) * _MS)[row[active],
+                                                  np.arange(len(active))]
+            swap = f_c * f_b[active] < 0.
+            a[active] = np.where(swap, b[active], a[active])
+            f_a[active] = np.where(swap, f_b[active], f_a[active] * 0.5)
+            step[active] = np.abs(c - b[active])
+            b[active], f_b[active] = c, f_c
+        crossings = start + b.astype(np.int64) * _MS
+        begins = crossings[rising]
+        ends = crossings[(row == 0) & ~rising]
+        if positive[0, 0]:
+            begins = np.insert(begins, 0, start)
+        if positive[0, -1]:
+            ends = np.append(ends, end)
 
-        to_date = to_date if to_date else from_date + timedelta(hours=1)
-        diff = (to_date - from_date).total_seconds() / 60
-        assert diff % t_delta == 0, "Unequal intervals between from and to!"
-        while from_date <= to_date:
-            yield from_date
-            from_date += timedelta(minutes=t_delta)
+        return begins, ends, crossings[row > 0]
 
-    @staticmethod
-    def _mean_hours(
-            p: list,
-            t_delta: int = 60
-    ) -> float:
+    def sun_parameters(
+            self,
+            times: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, float]:
         """
-        Sum over means of all adjacent neighbors in list p
-        :param p:
-        :param t_delta: intervals in minutes
-        :return: energy Wh
+        vectorized equivalent of sun_parameter for an array of timestamps
+        :param times: datetime64, UTC
+        :return:
+        * power on the ground in units of Wm⁻² per timestamp
+        * direct sunlight on all PV panels in units of W per timestamp
+        * diffuse factor of all (tilted) PV panels in units of m²
         """
 
-        return (t_delta / 60 *
-                sum([(p[i] + p[i + 1]) / 2 for i in range(len(p) - 1)]))
+        el, az = self._position(times)
+        attenuation, _ = air_mass_vector(
+            elevation=el,
+            altitude=self.parameter["location"]["altitude"]["value"])
+        attenuation = np.where(el > 0., attenuation, 0.)
+        power = SOLAR_CONSTANT * np.sin(np.radians(el)) * attenuation
+        direct = (SOLAR_CONSTANT * attenuation
+                  * (np.maximum(self._incidence(el, az), 0.)
+                     @ self.__area_eff))
+
+        return power, direct, self.panels.diffuse
+
+    def calc_horizon(
+            self,
+            *,
+            dates: list[datetime],
+            t_delta: int = 12,
+            method: str | None = None,
+            tolerance: float | None = None
+    ) -> tuple[np.ndarray, ...]:
+        """
+        Integrates the energies over all intervals between adjacent dates in
+        one pass:
+        "trapezoid": solar geometry is evaluated once on a grid of t_delta
+        minutes spanning the entire horizon and integrated by the trapezoidal
+        rule
+        "gauss": intervals are clipped to daylight, split where the sun
+        passes the planes of the panel groups and integrated by adaptive
+        Gauss-Legendre quadrature to within tolerance, nights are skipped
+        :param dates: ascending, all intervals multiples of t_delta
+        :param t_delta: grid spacing in minutes, trapezoid only
+        :param method: [trapezoid|gauss], default from parameter
+        "integration", trapezoid otherwise
+        :param tolerance: relative error per interval, gauss only, default
+        from parameter "integration", 1e-3 otherwise
+        :return: per interval, i.e. len(dates) - 1 values each
+        * accumulated energy on the ground in units of Wm⁻²
+        * direct sunlight on the PV panels in units of Wh
+        * diffuse sunlight on the (tilted) PV panels in units of hm²,
+        to be multiplied by Wm⁻²
+        """
+
+        times = to_datetime64(dates)
+        method = method or self.integration.get('method', TRAPEZOID)
+        if method == GAUSS:
+            return self._calc_horizon_gauss(
+                times=times,
+                tolerance=tolerance or self.integration.get('tolerance', 1e-3))
+        offsets = (times - times[0]) / np.timedelta64(t_delta, 'm')
+        assert np.all(offsets % 1 == 0), "Unequal intervals between dates!"
+        grid = times[0] + np.arange(int(offsets[-1]) + 1) * np.timedelta64(
+            t_delta, 'm')
+        power, direct, diffuse = self.sun_parameters(grid)
+        # cumulative trapezoidal integral on the grid in units of hours
+        hours = t_delta / 60
+
+        def cumulated(p: np.ndarray) -> np.ndarray:
+            return np.concatenate(
+                ([0.], np.cumsum((p[:-1] + p[1:]) * 0.5 * hours)))
+
+        index = offsets.astype(int)
+
+        return (np.diff(cumulated(power)[index]),
+                np.diff(cumulated(direct)[index]),
+                np.diff(index) * hours * diffuse)
+
+    def _calc_horizon_gauss(
+            self,
+            *,
+            times: np.ndarray,
+            tolerance: float
+    ) -> tuple[np.ndarray, ...]:
+        """
+        calc_horizon by adaptive Gauss-Legendre quadrature over the
+        pieces of intervals in daylight, on which the integrands are smooth
+        :param times: datetime64
+        :param tolerance: relative error per interval
+        :return: as calc_horizon
+        """
+
+        times = times.astype('datetime64[ms]')
+        begins, ends, passages = self._breakpoints(times[0], times[-1])
+        # elementary pieces between all intervals and breakpoints, those
+        # in daylight are integrated
+        points = np.unique(np.concatenate((times, begins, ends, passages)))
+        lower, upper = points[:-1], points[1:]
+        mid = lower + (upper - lower) // 2
+        k = np.searchsorted(begins, mid, side='right') - 1
+        daylight = (k >= 0) & (mid < ends[np.maximum(k, 0)]) \
+            if len(begins) else np.zeros(len(mid), dtype=bool)
+        lower, upper, mid = lower[daylight], upper[daylight], mid[daylight]
+        interval = np.searchsorted(times, mid, side='right') - 1
+        t0 = times[0]
+
+        def integrand(seconds: np.ndarray) -> np.ndarray:
+            power, direct, _ = self.sun_parameters(
+                t0 + (seconds * 1_000.).astype(np.int64) * _MS)
+            return np.stack((power, direct))
+
+        pieces = _adaptive_gauss_legendre(
+            integrand,
+            (lower - t0) / _MS / 1_000.,
+            (upper - t0) / _MS / 1_000.,
+            tolerance=tolerance) / 3_600.  # units of hours
+        result = np.zeros((2, len(times) - 1))
+        np.add.at(result.T, interval, pieces.T)
+        _, _, diffuse = self.sun_parameters(times[:1])
+
+        return (result[0],
+                result[1],
+                np.diff(times) / np.timedelta64(1, 'h') * diffuse)
 
     def calc_modified(
             self,
@@ -159,34 +429,46 @@ class SunInflux(object):
         in the period from_date until to_date, to be multiplied by Wm⁻²
         """
 
-        powers = list()
-        panels = list()
-        diffuse = list()
-        t_delta: int = 12  # minutes
+        if to_date:
+            return tuple(
+                float(r[0]) for r in self.calc_horizon(
+                    dates=[from_date, to_date]))
+        power, direct, diffuse = self.sun_parameters(
+            to_datetime64([from_date]))
 
-        for item in self._date_generator(from_date=from_date,
-                                         to_date=to_date,
-                                         t_delta=t_delta):
-            res = self.sun_parameter(dateandtime=item)[item]
-            powers.append(res['sun']['power'])
-            panels.append(res['panels']['direct'])
-            diffuse.append(res['panels']['diffuse'])
+        return float(power[0]), float(direct[0]), diffuse
 
-        if to_date:
-            accumulated = self._mean_hours(
-                p=powers,
-                t_delta=t_delta)
-            panels_all = self._mean_hours(
-                p=panels,
-                t_delta=t_delta)
-            diffuse_all = self._mean_hours(
-                p=diffuse,
-                t_delta=t_delta)
-        else:
-            accumulated = powers[0]
-            panels_all = panels[0]
-            diffuse_all = diffuse[0]
 
-        return (accumulated,
-                panels_all,
-                diffuse_all)
+if __name__ == "__main__":
+    import json
+    from datetime import timedelta
+    from timeit import timeit
+
+    with open("{}/data/parameter.json".format(
+            os.path.dirname(os.path.realpath(__file__))), "r") as f:
+        config = json.load(f)
+    z = SunInflux(parameter=config, ephemeris=False)
+    # 15-day ECMWF horizon: 3-hourly up to 144 hrs, 6-hourly thereafter
+    start = datetime(2026, 3, 20)
+    horizon = ([start + timedelta(hours=h) for h in range(0, 144, 3)]
+               + [start + timedelta(hours=h) for h in range(144, 361, 6)])
+    reference = z.calc_horizon(dates=horizon, method=GAUSS, tolerance=1e-10)
+    number = 20
+
+    for name, kwargs in (("trapezoid 12 min", {"method": TRAPEZOID}),
+                         ("trapezoid 1 min", {"method": TRAPEZOID,
+                                              "t_delta": 1}),
+                         ("gauss 1e-3", {"method": GAUSS}),
+                         ("gauss 1e-6", {"method": GAUSS, "tolerance": 1e-6})):
+        z.evaluations = 0
+        result = z.calc_horizon(dates=horizon, **kwargs)
+        evaluations = z.evaluations
+        t = timeit(lambda: z.calc_horizon(dates=horizon, **kwargs),
+                   number=number)
+        print("{0:<17}: {1:>6} evaluations, {2:6.2f} ms, rel. error "
+              "ground: {3:.1e}, panels: {4:.1e}".format(
+            name,
+            evaluations,
+            t / number * 1e3,
+            np.abs(result[0] - reference[0]).sum() / reference[0].sum(),
+            np.abs(result[1] - reference[1]).sum() / reference[1].sum()))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+"""
+sun_vector.py
+
+NumPy-vectorized solar geometry and irradiance, evaluated for entire arrays
+of timestamps at once. Solar position follows the NOAA algorithm as
+implemented by astral.sun.zenith_and_azimuth (including refraction), air
+mass follows fronius_aux.
+All times in UTC.
+"""
+from datetime import datetime, timezone
+from typing import Iterable
+
+import numpy as np
+
+_EPOCH_JULIAN_DAY = 2_440_587.5  # 1970-01-01T00:00 UTC
+_J2000 = 2_451_545.0
+
+
+def to_datetime64(dates: Iterable[datetime] | np.ndarray) -> np.ndarray:
+    """
+    timestamps as naive UTC datetime64[s], aware datetimes are converted
+    :param dates:
+    :return:
+    """
+
+    if isinstance(dates, np.ndarray) and dates.dtype.kind == "M":
+        return dates.astype("datetime64[s]")
+
+    return np.array(
+        [d.astimezone(timezone.utc).replace(tzinfo=None)
+         if d.tzinfo else d for d in dates],
+        dtype="datetime64[s]")
+
+
+def refraction(elevation: np.ndarray) -> np.ndarray:
+    """
+    refraction correction in degrees, astral.refraction_at_zenith
+    :param elevation: geometric elevation in degrees
+    :return:
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        te = np.tan(np.radians(elevation))
+        correction = np.where(
+            elevation > 5.,
+            58.1 / te - 0.07 / te ** 3 + 0.000086 / te ** 5,
+            np.where(
+                elevation > -0.575,
+                1735. + elevation * (-518.2 + elevation * (
+                        103.4 + elevation * (-12.79 + elevation * 0.711))),
+                -20.774 / te))
+
+    return np.where(elevation >= 85., 0., correction / 3600.)
+
+
+def solar_position(
+        times: np.ndarray,
+        *,
+        latitude: float,
+        longitude: float,
+        with_refraction: bool = True
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    sun elevation and azimuth
+    :param times: datetime64, naive UTC, resolution up to ms
+    :param latitude: degrees
+    :param longitude: degrees
+    :param with_refraction: if True, elevation is corrected for refraction
+    :return: elevation, azimuth (clockwise from North) in degrees
+    """
+
+    latitude = min(max(latitude, -89.8), 89.8)
+    seconds = times.astype("datetime64[ms]").astype(np.int64) / 1_000.
+    jc = ((seconds / 86_400. + _EPOCH_JULIAN_DAY) - _J2000) / 36_525.
+
+    # orbital elements
+    l0 = np.radians((280.46646 + jc * (36000.76983 + 0.0003032 * jc)) % 360.)
+    m = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    e = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    c = (np.sin(m) * (1.914602 - jc * (0.004817 + 0.000014 * jc))
+         + np.sin(2. * m) * (0.019993 - 0.000101 * jc)
+         + np.sin(3. * m) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * jc)
+    apparent_long = np.radians(
+        np.degrees(l0) + c - 0.00569 - 0.00478 * np.sin(omega))
+    seconds_obliquity = 21.448 - jc * (
+            46.815 + jc * (0.00059 - jc * 0.001813))
+    obliquity = np.radians(23. + (26. + seconds_obliquity / 60.) / 60.
+                           + 0.00256 * np.cos(omega))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_long))
+    y = np.tan(obliquity / 2.) ** 2
+    eq_of_time = 4. * np.degrees(
+        y * np.sin(2. * l0)
+        - 2. * e * np.sin(m)
+        + 4. * e * y * np.sin(m) * np.cos(2. * l0)
+        - 0.5 * y * y * np.sin(4. * l0)
+        - 1.25 * e * e * np.sin(2. * m))  # minutes
+
+    minutes = (seconds % 86_400) / 60.
+    true_solar_time = minutes + eq_of_time + 4. * longitude
+    hour_angle = np.radians((true_solar_time / 4.) % 360. - 180.)
+
+    sl, cl = np.sin(np.radians(latitude)), np.cos(np.radians(latitude))
+    sd, cd = np.sin(declination), np.cos(declination)
+    csz = np.clip(cl * cd * np.cos(hour_angle) + sl * sd, -1., 1.)
+    zenith = np.degrees(np.arccos(csz))
+
+    az_denom = cl * np.sin(np.radians(zenith))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        az_rad = np.clip(
+            (sl * np.cos(np.radians(zenith)) - sd) / az_denom, -1., 1.)
+    az = 180. - np.degrees(np.arccos(az_rad))
+    az = np.where(hour_angle > 0., -az, az)
+    az = np.where(np.abs(az_denom) > 0.001, az,
+                  180. if latitude > 0. else 0.)
+    az = np.where(az < 0., az + 360., az)
+
+    elevation = 90. - zenith
+    if with_refraction:
+        elevation = elevation + refraction(elevation)
+
+    return elevation, az
+
+
+def air_mass(
+        elevation: np.ndarray,
+        altitude: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    air mass attenuation after Kasten and Young, as fronius_aux.air_mass,
+    valid for elevation > 0 only, NaN otherwise
+    :param elevation: sun elevation angles in degrees
+    :param altitude: altitude of location in meters
+    :return:
+    air mass attenuation factors,
+    air masses
+    """
+
+    a = 0.00014 * altitude  # altitude correction factor
+    with np.errstate(invalid='ignore'):
+        air_mass_revised = 1. / (
+                np.sin(np.radians(elevation))
+                + 0.50572 * (6.07995 + elevation) ** -1.6364)
+        air_mass_revised = np.where(elevation > 0., air_mass_revised, np.nan)
+
+        return ((1. - a) * 0.7 ** (air_mass_revised ** 0.678) + a,
+                air_mass_revised)
+